@@ -1,3 +1,4 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
@@ -7,12 +8,28 @@ from app.core.config import settings
 from app.models.user import User, UserInDB
 from app.services.user_service import user_service
 
-from sqlmodel import Session
-from app.core.database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.database import get_session, async_session
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login/access-token")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login/access-token", auto_error=False)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_session)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_session)) -> User:
+    return await _user_from_token(token, db)
+
+async def get_current_user_for_stream(
+    token: Optional[str] = Depends(oauth2_scheme_optional), access_token: Optional[str] = None
+) -> User:
+    # For long-lived responses (SSE). EventSource can't send headers, so the token may
+    # also come as ?access_token=. Uses its own short session instead of get_session,
+    # which would hold a pooled connection for as long as the stream stays open.
+    token = token or access_token
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    async with async_session() as db:
+        return await _user_from_token(token, db)
+
+async def _user_from_token(token: str, db: AsyncSession) -> User:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[security.ALGORITHM])
         token_data = payload.get("sub")
@@ -21,7 +38,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except (JWTError, ValidationError):
         raise HTTPException(status_code=403, detail="Could not validate credentials")
         
-    user = user_service.get_user_by_email(db, email=token_data)
+    user = await user_service.get_cached_user_by_email(db, email=token_data)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
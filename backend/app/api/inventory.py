@@ -3,7 +3,7 @@ from app.services.inventory_service import inventory_service
 from app.api import deps
 from app.models.user import User, UserRole
 from pydantic import BaseModel
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.core.database import get_session
 router = APIRouter()
 
@@ -13,20 +13,20 @@ class StockAdjustment(BaseModel):
     reason: str = "Manual adjustment"
 
 @router.get("/{product_id}", response_model=int)
-async def get_stock(product_id: str, db: Session = Depends(get_session)):
-    return inventory_service.get_stock(db, product_id)
+async def get_stock(product_id: str, db: AsyncSession = Depends(get_session)):
+    return await inventory_service.get_stock(db, product_id)
 
 @router.post("/adjust")
 async def adjust_stock(
     adjustment: StockAdjustment,
     current_user: User = Depends(deps.get_current_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_session)
 ):
     if current_user.role != UserRole.SELLER and current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Not authorized")
         
     try:
-        new_qty = inventory_service.adjust_stock(
+        new_qty = await inventory_service.adjust_stock(
             db,
             adjustment.product_id, 
             adjustment.adjustment, 
@@ -1,47 +1,106 @@
-from fastapi import APIRouter, HTTPException, Body, Depends
-from typing import List, Dict, Any
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Body, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Optional
+from datetime import date, datetime, time, timedelta
 from app.services.cart_service import cart_service
 from app.services.order_service import order_service
-from app.models.cart import Cart, CartRead
-from app.models.order import Order, OrderRead
+from app.models.cart import Cart, CartRead, CartOperation
+from app.models.order import Order, OrderRead, OrderItemStatusUpdate, OrderItemStatusResult, ITEM_STATUSES
 from app.api import deps
 from app.models.user import User
-from sqlmodel import Session
-from app.core.database import get_session
-import os
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core import events
 from app.core.config import settings
-from fastapi.responses import FileResponse
+from app.core.database import get_session
+from app.core.pagination import encode_cursor
+from app.services.invoice_service import InvoicePending, invoice_service
+from app.services.invoice_export_service import invoice_export_service
+from app.services.idempotency_service import idempotency_service
 
 router = APIRouter()
 
 @router.get("/cart", response_model=CartRead)
-def get_cart(current_user: User = Depends(deps.get_current_user), db: Session = Depends(get_session)):
-    return cart_service.get_cart(db, current_user.id)
+async def get_cart(current_user: User = Depends(deps.get_current_user), db: AsyncSession = Depends(get_session)):
+    return await cart_service.get_cart(db, current_user.id)
 
 @router.post("/cart/add", response_model=CartRead)
-def add_to_cart(item: Dict[str, Any] = Body(...), current_user: User = Depends(deps.get_current_user), db: Session = Depends(get_session)):
+async def add_to_cart(
+    item: Dict[str, Any] = Body(...),
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(get_session)
+):
     # Item expects: product_id, quantity, price, product_name
-    return cart_service.add_item(db, current_user.id, item)
+    return await idempotency_service.run(
+        db, idempotency_key, current_user.id, "cart/add", item,
+        lambda: cart_service.add_item(db, current_user.id, item), CartRead,
+    )
+
+@router.post("/cart/batch", response_model=CartRead)
+async def batch_update_cart(
+    operations: List[CartOperation] = Body(..., embed=True),
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(get_session)
+):
+    # All operations apply in one transaction, or none do
+    if len(operations) > settings.CART_BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.CART_BATCH_MAX_OPERATIONS} operations per request")
+    return await cart_service.apply_operations(db, current_user.id, operations)
 
 @router.put("/cart/items/{product_id}", response_model=CartRead)
-def update_cart_item(product_id: str, quantity: int = Body(..., embed=True), current_user: User = Depends(deps.get_current_user), db: Session = Depends(get_session)):
-    return cart_service.update_item_quantity(db, current_user.id, product_id, quantity)
+async def update_cart_item(product_id: str, quantity: int = Body(..., embed=True), current_user: User = Depends(deps.get_current_user), db: AsyncSession = Depends(get_session)):
+    return await cart_service.update_item_quantity(db, current_user.id, product_id, quantity)
 
 @router.delete("/cart/items/{product_id}", response_model=CartRead)
-def delete_cart_item(product_id: str, current_user: User = Depends(deps.get_current_user), db: Session = Depends(get_session)):
-    return cart_service.remove_item(db, current_user.id, product_id)
+async def delete_cart_item(product_id: str, current_user: User = Depends(deps.get_current_user), db: AsyncSession = Depends(get_session)):
+    return await cart_service.remove_item(db, current_user.id, product_id)
 
 @router.post("/orders/checkout", response_model=OrderRead)
-def checkout(current_user: User = Depends(deps.get_current_user), db: Session = Depends(get_session)):
-    return order_service.create_order_from_cart(db, current_user.id)
+async def checkout(
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(get_session)
+):
+    # A retried checkout with the same key replays the first order instead of placing another
+    return await idempotency_service.run(
+        db, idempotency_key, current_user.id, "orders/checkout", None,
+        lambda: order_service.create_order_from_cart(db, current_user.id), OrderRead,
+    )
+
+@router.get("/events")
+async def order_events(request: Request, current_user: User = Depends(deps.get_current_user_for_stream)):
+    # Server-Sent Events: order.created / order.item_status / invoice.ready for the
+    # caller's orders, plus the orders containing a seller's items
+    channels = [events.user_channel(current_user.id)]
+    if current_user.role == "seller":
+        channels.append(events.seller_channel(current_user.id))
+    return StreamingResponse(
+        _event_stream(request, channels),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _event_stream(request: Request, channels: List[str]):
+    async with events.broker.subscribe(*channels) as subscription:
+        yield ": connected\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line: keeps proxies from closing an idle connection
+                yield ": ping\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
 
 @router.get("/orders", response_model=List[OrderRead])
-def list_my_orders(page: int = 1, limit: int = 20, current_user: User = Depends(deps.get_current_user), db: Session = Depends(get_session)):
-    return order_service.list_user_orders(db, current_user.id, page, limit)
+async def list_my_orders(page: int = 1, limit: int = 20, current_user: User = Depends(deps.get_current_user), db: AsyncSession = Depends(get_session)):
+    return await order_service.list_user_orders(db, current_user.id, page, limit)
 
 @router.get("/orders/{order_id}", response_model=OrderRead)
-def get_order_details(order_id: str, current_user: User = Depends(deps.get_current_user), db: Session = Depends(get_session)):
-    order = order_service.get_order(db, order_id)
+async def get_order_details(order_id: str, current_user: User = Depends(deps.get_current_user), db: AsyncSession = Depends(get_session)):
+    order = await order_service.get_order(db, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -52,56 +111,97 @@ def get_order_details(order_id: str, current_user: User = Depends(deps.get_curre
     return order
 
 @router.get("/orders/{order_id}/invoice")
-def download_invoice(order_id: str, current_user: User = Depends(deps.get_current_user), db: Session = Depends(get_session)):
+async def download_invoice(order_id: str, current_user: User = Depends(deps.get_current_user), db: AsyncSession = Depends(get_session)):
     # Verify order existence and ownership
-    order = order_service.get_order(db, order_id)
+    order = await order_service.get_order(db, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-        
+
     if order.user_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
-        
-    if hasattr(order, "pdf_url") and order.pdf_url:
-        full_path = os.path.join(settings.UPLOAD_DIR, "invoices", "pdfs", os.path.basename(order.pdf_url))
-        # The stored url might be "invoices/pdfs/xyz.pdf". 
-        # So join settings.UPLOAD_DIR ("uploads") with "invoices/pdfs/..." 
-        # Wait, pdf_service implementation (Step 542): `output_dir = os.path.join(settings.UPLOAD_DIR, "invoices", "pdfs")`, and returns `f"invoices/pdfs/{filename}"`.
-        # So full_path = os.path.join(settings.UPLOAD_DIR, "invoices/pdfs/filename.pdf")? 
-        # No, `os.path.join(settings.UPLOAD_DIR, order.pdf_url)` should work if pdf_url is strict relative.
-        
-        full_path = os.path.join(settings.UPLOAD_DIR, "invoices", "pdfs", os.path.basename(order.pdf_url))
-        # Actually simplest is:
-        # If pdf_url is "invoices/pdfs/xxx.pdf", and UPLOAD_DIR is "/.../uploads"
-        # Then join(UPLOAD_DIR, pdf_url) -> "/.../uploads/invoices/pdfs/xxx.pdf" which matches where we saved it.
-        # But let's check what I wrote in Step 542: `output_dir = os.path.join(settings.UPLOAD_DIR, "invoices", "pdfs")`.
-        # So it is nested.
-        
-        full_path = os.path.join(settings.UPLOAD_DIR, "invoices", "pdfs", os.path.basename(order.pdf_url))
-        
-        if os.path.exists(full_path):
-             return FileResponse(full_path, media_type="application/pdf", filename=f"invoice_{order_id}.pdf")
-    
-    raise HTTPException(status_code=404, detail="Invoice PDF not found")
+
+    try:
+        content = await invoice_service.get_pdf(db, order)
+    except InvoicePending:
+        # Accepted, not an error: the PDF is being rendered, poll again
+        return Response(status_code=202, headers={"Retry-After": "1"})
+    if content is None:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return Response(
+        content=content,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="invoice_{order_id}.pdf"'},
+    )
 
 @router.get("/merchant/orders", response_model=List[OrderRead])
-def list_merchant_orders(current_user: User = Depends(deps.get_current_user), db: Session = Depends(get_session)):
+async def list_merchant_orders(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(get_session)
+):
+    # `status` filters on the seller's item status; start/end are inclusive order dates.
+    # The next page is requested with the X-Next-Cursor header value as `cursor`.
+    if current_user.role != "seller":
+         raise HTTPException(status_code=403, detail="Not authorized")
+    orders = await order_service.get_merchant_orders(
+        db, current_user.id, limit, cursor, status=status,
+        created_from=datetime.combine(start, time.min) if start else None,
+        created_to=datetime.combine(end + timedelta(days=1), time.min) if end else None,
+    )
+    if len(orders) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(orders[-1].created_at, orders[-1].id)
+    return orders
+
+@router.get("/merchant/invoices/export")
+async def export_merchant_invoices(
+    start: date,
+    end: date,
+    current_user: User = Depends(deps.get_current_user)
+):
+    if current_user.role != "seller":
+         raise HTTPException(status_code=403, detail="Not authorized")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+
+    # Both days inclusive
+    range_start = datetime.combine(start, time.min)
+    range_end = datetime.combine(end + timedelta(days=1), time.min)
+    return StreamingResponse(
+        invoice_export_service.export_invoices(current_user.id, range_start, range_end),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="invoices_{start}_{end}.zip"'},
+    )
+
+@router.put("/merchant/orders/items/status", response_model=List[OrderItemStatusResult])
+async def update_item_statuses(
+    updates: List[OrderItemStatusUpdate] = Body(..., embed=True),
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(get_session)
+):
+    # Per-item outcomes; items that fail don't stop the rest of the batch
     if current_user.role != "seller":
          raise HTTPException(status_code=403, detail="Not authorized")
-    return order_service.get_merchant_orders(db, current_user.id)
+    if len(updates) > settings.ORDER_ITEM_STATUS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {settings.ORDER_ITEM_STATUS_BATCH_MAX} updates per request")
+    return await order_service.update_order_item_statuses(db, current_user.id, updates)
 
 @router.put("/merchant/orders/{order_id}/items/{product_id}/status", response_model=OrderRead)
-def update_item_status(
+async def update_item_status(
     order_id: str, 
     product_id: str, 
     status: str = Body(..., embed=True), 
     current_user: User = Depends(deps.get_current_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_session)
 ):
     if current_user.role != "seller":
          raise HTTPException(status_code=403, detail="Not authorized")
     
-    allowed_statuses = ["pending", "accepted", "packing", "out_for_delivery", "delivered", "cancelled"]
-    if status not in allowed_statuses:
+    if status not in ITEM_STATUSES:
          raise HTTPException(status_code=400, detail="Invalid status")
 
-    return order_service.update_order_item_status(db, order_id, product_id, status, current_user.id)
+    return await order_service.update_order_item_status(db, order_id, product_id, status, current_user.id)
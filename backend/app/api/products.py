@@ -1,19 +1,33 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from app.models.product import Product, ProductCreate
 from app.services.product_service import product_service
+from app.services.product_bulk_service import product_bulk_service
 from app.api import deps
 from app.models.user import User, UserRole
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.core.database import get_session
+from app.core.pagination import encode_cursor
+from app.core.http_cache import make_etag, cache_headers, is_not_modified
 
 router = APIRouter()
 
+def _conditional(request: Request, response: Response, products: List[Product]) -> Optional[Response]:
+    # Validators come from (id, updated_at) of every product in the body
+    etag = make_etag(f"{p.id}:{p.updated_at.isoformat()}" for p in products)
+    last_modified = max((p.updated_at for p in products), default=None)
+    headers = cache_headers(etag, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
 @router.post("/", response_model=Product)
 async def create_product(
     product_in: ProductCreate, 
     current_user: User = Depends(deps.get_current_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_session)
 ):
     if current_user.role != UserRole.SELLER and current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Only sellers can create products")
@@ -21,56 +35,109 @@ async def create_product(
     # Force seller_id to be the current user
     product_in.seller_id = current_user.id
     
-    return product_service.create_product(db, product_in)
+    return await product_service.create_product(db, product_in)
+
+@router.post("/bulk")
+async def bulk_import_products(
+    request: Request,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(get_session)
+):
+    # Body is NDJSON (one ProductCreate object per line) or CSV with a header row,
+    # picked by Content-Type. It is parsed as it streams in.
+    if current_user.role != UserRole.SELLER and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Only sellers can create products")
+    fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    return await product_bulk_service.import_products(db, request.stream(), fmt, current_user.id)
+
+@router.get("/export")
+async def export_products(
+    format: str = "ndjson",
+    current_user: User = Depends(deps.get_current_user)
+):
+    if current_user.role != UserRole.SELLER and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        product_bulk_service.export_products(current_user.id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=products.{format}"},
+    )
 
 @router.get("/", response_model=List[Product])
-async def list_products(page: int = 1, limit: int = 20, db: Session = Depends(get_session)):
-    return product_service.list_products(db, page, limit)
+async def list_products(
+    request: Request,
+    response: Response,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    seller_id: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    db: AsyncSession = Depends(get_session)
+):
+    # `cursor` (from the previous page's X-Next-Cursor header) takes precedence over `page`.
+    # Text search is ordered by relevance, so it pages with `page` only.
+    if q and cursor:
+        raise HTTPException(status_code=400, detail="cursor can't be combined with q, use page")
+    products = await product_service.list_products(
+        db, page, limit, cursor,
+        q=q, category=category, min_price=min_price, max_price=max_price,
+        seller_id=seller_id, in_stock=in_stock,
+    )
+    if not q and len(products) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(products[-1].created_at, products[-1].id)
+    return _conditional(request, response, products) or products
 
 @router.get("/details/{product_id}", response_model=Product)
-async def get_product_details(product_id: str, db: Session = Depends(get_session)):
+async def get_product_details(product_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_session)):
     # Search for product across all sellers
-    product = product_service.get_product(db, product_id)
+    product = await product_service.get_product(db, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return _conditional(request, response, [product]) or product
 
 @router.get("/{seller_id}/{product_id}", response_model=Product)
-async def get_product(seller_id: str, product_id: str, db: Session = Depends(get_session)):
-    product = product_service.get_product(db, product_id)
+async def get_product(seller_id: str, product_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_session)):
+    product = await product_service.get_product(db, product_id)
     # Check seller_id match if needed, for now just get product by id and verify seller in service maybe? 
     # Current service get_product only takes db and id.
     if product and product.seller_id != seller_id:
         raise HTTPException(status_code=404, detail="Product not found for this seller")
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return _conditional(request, response, [product]) or product
 
 @router.put("/{product_id}", response_model=Product)
-def update_product(
+async def update_product(
     product_id: str,
     product_in: ProductCreate,
     current_user: User = Depends(deps.get_current_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_session)
 ):
     if current_user.role != UserRole.SELLER and current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Not authorized")
         
-    product = product_service.update_product(db, product_id, product_in, current_user.id)
+    product = await product_service.update_product(db, product_id, product_in, current_user.id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
 @router.delete("/{product_id}")
-def delete_product(
+async def delete_product(
     product_id: str,
     current_user: User = Depends(deps.get_current_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_session)
 ):
     if current_user.role != UserRole.SELLER and current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Not authorized")
         
-    success = product_service.delete_product(db, product_id, current_user.id)
+    success = await product_service.delete_product(db, product_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Product not found")
     return {"status": "success", "message": "Product deleted"}
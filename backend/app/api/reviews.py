@@ -1,25 +1,36 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends
-from app.models.review import Review, ReviewCreate
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from app.models.review import Review, ReviewCreate, ReviewSort
 from app.models.user import User
 from app.api import deps
 from app.services.review_service import review_service
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.core.database import get_session
 
 router = APIRouter()
 
 @router.post("/", response_model=Review)
-def create_review(
+async def create_review(
     review_in: ReviewCreate,
     current_user: User = Depends(deps.get_current_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_session)
 ):
-    review = review_service.create_review(db, review_in, current_user.id, current_user.full_name or "Anonymous")
+    review = await review_service.create_review(db, review_in, current_user.id, current_user.full_name or "Anonymous")
     if not review:
         raise HTTPException(status_code=400, detail="Please buy the product to give review")
     return review
 
 @router.get("/{product_id}", response_model=List[Review])
-def list_reviews(product_id: str, db: Session = Depends(get_session)):
-    return review_service.list_reviews(db, product_id)
+async def list_reviews(
+    product_id: str,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sort: ReviewSort = ReviewSort.NEWEST,
+    db: AsyncSession = Depends(get_session)
+):
+    # The next page is requested with the X-Next-Cursor header value as `cursor` (same `sort`).
+    reviews = await review_service.list_reviews(db, product_id, limit, cursor, sort)
+    if len(reviews) == limit:
+        response.headers["X-Next-Cursor"] = review_service.review_cursor(reviews[-1], sort)
+    return reviews
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# Every cache registers itself here so the hit/miss counters can be exposed in one place
+caches: Dict[str, "TTLCache"] = {}
+
+class TTLCache:
+    """Per-process LRU cache whose entries also expire after ttl seconds.
+
+    With maxbytes set, values must support len() (e.g. bytes) and the cache also
+    evicts least recently used entries until their total length fits.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 60.0, maxbytes: Optional[int] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        caches[name] = self
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0 or (self.maxbytes is not None and len(value) > self.maxbytes):
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            if self.maxbytes is not None:
+                self._bytes += len(value)
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self._bytes > self.maxbytes):
+                self._remove(next(iter(self._data)))
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is not None and self.maxbytes is not None:
+            self._bytes -= len(entry[1])
+
+    def stats(self) -> dict:
+        stats = {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+        if self.maxbytes is not None:
+            stats.update(bytes=self._bytes, maxbytes=self.maxbytes)
+        return stats
+
+def get_cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in caches.items()}
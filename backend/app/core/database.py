@@ -1,12 +1,183 @@
-from sqlmodel import SQLModel, create_engine, Session
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Sequence
+from sqlalchemy import event, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.core.config import settings
 
-# echo=True for debugging, can be turned off in prod
-engine = create_engine(settings.DATABASE_URL, echo=False)
+logger = logging.getLogger(__name__)
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
+# Map the sync drivers people already have in their DATABASE_URL to async ones,
+# so existing deployments (mysql+pymysql://, sqlite://) keep working unchanged.
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
 
-def get_session():
-    with Session(engine) as session:
+def get_async_database_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that also records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+def _engine_options(url: str) -> dict:
+    options = {"echo": False}  # echo=True for debugging, can be turned off in prod
+    if url.startswith("sqlite"):
+        # SQLite has no server side connections worth pooling, keep the dialect default
+        return options
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    return options
+
+DATABASE_URL = get_async_database_url(settings.DATABASE_URL)
+engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+# expire_on_commit=False: attributes must stay readable after commit, an expired
+# attribute would need an implicit (sync) lazy load which AsyncSession can't do.
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+class QueryLimitExceeded(RuntimeError):
+    pass
+
+# Statement counter of the current request; None outside count_queries()
+_query_count: ContextVar[Optional[List[int]]] = ContextVar("query_count", default=None)
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_count.get()
+    if counter is None:
+        return
+    counter[0] += 1
+    if settings.QUERY_COUNT_LIMIT and counter[0] > settings.QUERY_COUNT_LIMIT:
+        raise QueryLimitExceeded(f"More than {settings.QUERY_COUNT_LIMIT} queries in one request, at: {statement}")
+
+@contextmanager
+def count_queries():
+    # A one-item list so tasks spawned from this context share the same count
+    counter = [0]
+    token = _query_count.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_count.reset(token)
+
+def _upgrade_schema(conn):
+    # create_all only creates missing tables. Bring existing tables up to date with
+    # columns and indexes added to the models later. New columns on existing tables
+    # must be nullable or carry a server_default.
+    inspector = inspect(conn)
+    for table in SQLModel.metadata.sorted_tables:
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                logger.info("Adding column %s.%s", table.name, column.name)
+                spec = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {conn.dialect.identifier_preparer.format_table(table)} ADD COLUMN {spec}"))
+        indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                logger.info("Creating index %s on %s", index.name, table.name)
+                index.create(conn)
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_upgrade_schema)
+
+async def warm_pool(connections: Optional[int] = None):
+    # Open the connections up front so the first requests don't pay for the handshake
+    connections = settings.DB_POOL_SIZE if connections is None else connections
+    if not isinstance(engine.pool, InstrumentedQueuePool):
+        return
+    connections = min(connections, engine.pool.size())
+    if connections <= 0:
+        return
+    opened = await asyncio.gather(*(engine.connect() for _ in range(connections)), return_exceptions=True)
+    for conn in opened:
+        if isinstance(conn, Exception):
+            logger.warning("Pool warm-up connection failed: %s", conn)
+        else:
+            await conn.close()
+    logger.info("Connection pool warmed: %s", engine.pool.status())
+
+def get_pool_stats() -> dict:
+    pool = engine.pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checkouts": pool.checkouts,
+        "timeouts": pool.timeouts,
+        "avg_wait_ms": round(pool.total_wait / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+        "max_wait_ms": round(pool.max_wait * 1000, 3),
+    }
+
+def upsert(model, rows: List[dict], key: Sequence[str], update: Sequence[str] = ()):
+    """Multi-row INSERT for rows that may already exist under the unique index `key`.
+
+    Existing rows get their `update` columns overwritten, or are left alone if
+    there are none. One statement, so concurrent writers can't race on a check.
+    """
+    table = model.__table__
+    dialect = engine.dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table).values(rows)
+        # A no-op assignment rather than INSERT IGNORE, which would hide other errors too
+        assignments = {c: statement.inserted[c] for c in update} or {key[0]: table.c[key[0]]}
+        return statement.on_duplicate_key_update(assignments)
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(f"upsert is not supported on {dialect}")
+    statement = insert(table).values(rows)
+    if update:
+        return statement.on_conflict_do_update(index_elements=list(key), set_={c: statement.excluded[c] for c in update})
+    return statement.on_conflict_do_nothing(index_elements=list(key))
+
+async def get_session():
+    async with async_session() as session:
         yield session
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Set
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pub/sub for pushing order updates to connected clients (see /store/events).
+# Channels are per user ("user:<id>") and per seller ("seller:<id>"); events are
+# small JSON-able dicts with a "type" key.
+
+def user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+def seller_channel(seller_id: str) -> str:
+    return f"seller:{seller_id}"
+
+class Subscription:
+    """Bounded per-subscriber queue. A client that falls behind loses its oldest events."""
+
+    def __init__(self, maxsize: int):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, event: dict):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self._queue.get()
+
+class Broker(ABC):
+    @abstractmethod
+    async def publish(self, channel: str, event: dict):
+        """Delivers the event to the channel's current subscribers."""
+
+    @abstractmethod
+    def subscribe(self, *channels: str):
+        """Async context manager yielding a Subscription to the given channels."""
+
+    async def close(self):
+        pass
+
+class InMemoryBroker(Broker):
+    # Single process only: events published by one worker never reach another's clients
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    async def publish(self, channel: str, event: dict):
+        for subscription in list(self._subscribers.get(channel, ())):
+            subscription.put(event)
+
+    @asynccontextmanager
+    async def subscribe(self, *channels: str) -> AsyncIterator[Subscription]:
+        subscription = Subscription(settings.EVENTS_QUEUE_SIZE)
+        for channel in channels:
+            self._subscribers[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            for channel in channels:
+                self._subscribers[channel].discard(subscription)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+class RedisBroker(Broker):
+    # Shares events between all app workers through Redis PUBLISH/SUBSCRIBE
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("EVENT_BROKER_URL points at Redis but the 'redis' package is not installed")
+        self._redis = redis.Redis.from_url(url)
+
+    async def publish(self, channel: str, event: dict):
+        await self._redis.publish(channel, json.dumps(event))
+
+    @asynccontextmanager
+    async def subscribe(self, *channels: str) -> AsyncIterator[Subscription]:
+        subscription = Subscription(settings.EVENTS_QUEUE_SIZE)
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(*channels)
+
+        async def pump():
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    subscription.put(json.loads(message["data"]))
+
+        reader = asyncio.create_task(pump())
+        try:
+            yield subscription
+        finally:
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+            await pubsub.unsubscribe(*channels)
+            await pubsub.aclose()
+
+    async def close(self):
+        await self._redis.aclose()
+
+def create_broker(url: str) -> Broker:
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBroker(url)
+    if url == "memory://":
+        return InMemoryBroker()
+    raise ValueError(f"Unsupported EVENT_BROKER_URL: {url}")
+
+broker = create_broker(settings.EVENT_BROKER_URL)
+
+async def publish(channel: str, event: dict):
+    # Push is best effort: a broker hiccup must never fail the write that triggered it
+    try:
+        await broker.publish(channel, event)
+    except Exception:
+        logger.exception("Publishing %s to %s failed", event.get("type"), channel)
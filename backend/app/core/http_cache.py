@@ -0,0 +1,37 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+from fastapi import Request
+
+# Conditional GET helpers: validators are derived from the rows' updated_at
+# (stored as naive UTC), so they change whenever a row is written.
+
+def make_etag(parts: Iterable) -> str:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+def cache_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    # no-cache: clients may store the response but must revalidate before reusing it
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have second precision
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
@@ -0,0 +1,30 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+# Keyset cursors are opaque to clients: a urlsafe-base64 JSON list of the sort key
+# of the last row on the previous page, e.g. (created_at, id).
+
+def encode_cursor(*values: Any) -> str:
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(raw, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(raw, list) or len(raw) != len(types):
+            raise ValueError("cursor shape")
+        return [datetime.fromisoformat(v) if t is datetime else t(v) for t, v in zip(types, raw)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def after_cursor(columns: List[Any], values: List[Any], descending: bool = True):
+    """WHERE clause for the rows past `values` when ordering by `columns`, all in one direction."""
+    column, value = columns[0], values[0]
+    past = column < value if descending else column > value
+    if len(columns) == 1:
+        return past
+    return or_(past, and_(column == value, after_cursor(columns[1:], values[1:], descending)))
@@ -1,6 +1,9 @@
+import asyncio
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Any, Union
+from fastapi import HTTPException
 from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
@@ -30,3 +33,32 @@ def get_password_hash(password: str) -> str:
     pwd_bytes = password.encode('utf-8')
     pre_hash = hashlib.sha256(pwd_bytes).hexdigest()
     return pwd_context.hash(pre_hash)
+
+# bcrypt gets its own small pool so a login/signup burst can't starve the shared
+# threadpool. bcrypt releases the GIL, so threads are enough here.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+
+async def _run_hasher(func, *args):
+    global _hash_pending
+    if _hash_pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        # Fail fast instead of queueing work we won't finish before the client gives up
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hasher(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_hasher(get_password_hash, password)
+
+def get_hasher_stats() -> dict:
+    return {
+        "workers": settings.PASSWORD_HASH_WORKERS,
+        "pending": _hash_pending,
+        "max_pending": settings.PASSWORD_HASH_MAX_PENDING,
+    }
@@ -0,0 +1,33 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Coroutine, List
+
+logger = logging.getLogger(__name__)
+
+class ServiceTasks:
+    """Long-running asyncio tasks a service starts with the app and cancels on shutdown."""
+
+    def __init__(self):
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, *coroutines: Coroutine):
+        self._tasks.extend(asyncio.create_task(coroutine) for coroutine in coroutines)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+async def run_periodically(job: Callable[[], Awaitable], interval: float, description: str, delay_first: bool = False):
+    """Awaits job() every `interval` seconds until cancelled. A failed run is logged and the loop goes on."""
+    if delay_first:
+        await asyncio.sleep(interval)
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("%s failed", description)
+        await asyncio.sleep(interval)
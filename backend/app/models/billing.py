@@ -1,7 +1,15 @@
 from datetime import datetime
+from enum import Enum
+from typing import Optional
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 import uuid
 
+class InvoiceStatus(str, Enum):
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
 class Invoice(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     order_id: str = Field(index=True)
@@ -11,3 +19,23 @@ class Invoice(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     status: str = "PAID"
     pdf_url: str = ""
+
+class InvoiceJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class InvoiceJob(SQLModel, table=True):
+    # Durable queue of invoice PDFs to render, written in the checkout transaction
+    __table_args__ = (Index("ix_invoicejob_status_run_after", "status", "run_after"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    invoice_id: str = Field(index=True)
+    order_id: str = Field(index=True)
+    status: InvoiceJobStatus = Field(default=InvoiceJobStatus.QUEUED)
+    attempts: int = 0
+    last_error: Optional[str] = None
+    run_after: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1,4 +1,6 @@
 from typing import List, Optional
+from enum import Enum
+from pydantic import FiniteFloat
 from sqlmodel import SQLModel, Field, Relationship
 from sqlalchemy import JSON, Column
 import uuid
@@ -7,7 +9,8 @@ class CartItemBase(SQLModel):
     product_id: str
     quantity: int
     product_name: Optional[str] = None
-    price: Optional[float] = None
+    # Finite: an inf/nan price would make the cart's total unserializable
+    price: Optional[FiniteFloat] = Field(default=None, ge=0)
     image: Optional[str] = None
 
 # Using a JSON column for items for simplicity in Cart, 
@@ -22,11 +25,28 @@ class CartItem(CartItemBase, table=True):
 class Cart(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True) # Usually user_id is the cart_id or we link user_id
     user_id: str = Field(unique=True, index=True)
-    items: List[CartItem] = Relationship(back_populates="cart")
+    # lazy="raise", as on Order.items (see app/models/order.py)
+    items: List[CartItem] = Relationship(back_populates="cart", sa_relationship_kwargs={"lazy": "raise"})
     total: float = 0.0
 
 class CartRead(SQLModel):
+    # Also the live cart kept in the cart store (see cart_store.py)
     id: str
     user_id: str
     total: float
-    items: List[CartItem] = []
+    items: List[CartItemBase] = []
+
+class CartOperationType(str, Enum):
+    ADD = "add"
+    SET = "set"
+    REMOVE = "remove"
+
+class CartOperation(SQLModel):
+    # add: quantity is added (item created if new); set: quantity replaces, <= 0 removes;
+    # remove: quantity ignored
+    op: CartOperationType
+    product_id: str
+    quantity: Optional[int] = None
+    product_name: Optional[str] = None
+    price: Optional[FiniteFloat] = Field(default=None, ge=0)
+    image: Optional[str] = None
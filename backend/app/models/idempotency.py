@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import Any, Optional
+from sqlmodel import SQLModel, Field
+from sqlalchemy import JSON, Column
+
+class IdempotencyKey(SQLModel, table=True):
+    # One row per (user, Idempotency-Key). status_code stays NULL while the first
+    # request is still running; afterwards the stored response is replayed.
+    user_id: str = Field(primary_key=True)
+    key: str = Field(primary_key=True, max_length=255)
+    endpoint: str
+    request_hash: str
+    status_code: Optional[int] = None
+    response_body: Optional[Any] = Field(default=None, sa_column=Column(JSON))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
@@ -1,8 +1,10 @@
 from typing import List, Optional
 from enum import Enum
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from datetime import datetime
 import uuid
+from app.models.billing import InvoiceStatus
 
 class OrderStatus(str, Enum):
     PENDING = "pending"
@@ -16,6 +18,11 @@ class OrderStatus(str, Enum):
     OUT_FOR_DELIVERY = "out_for_delivery"
     DELIVERED = "delivered"
 
+# Statuses a seller can move an item to; delivered/cancelled ones count as done
+# when deciding whether the whole order is completed
+ITEM_STATUSES = ["pending", "accepted", "packing", "out_for_delivery", "delivered", "cancelled"]
+ITEM_DONE_STATUSES = ["delivered", "cancelled", "completed"]
+
 class OrderItemBase(SQLModel):
     product_id: str
     quantity: int
@@ -25,6 +32,9 @@ class OrderItemBase(SQLModel):
     status: str = "pending"
 
 class OrderItem(OrderItemBase, table=True):
+    # Merchant order views look items up by seller, then group them by order
+    __table_args__ = (Index("ix_orderitem_seller_id_order_id", "seller_id", "order_id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     order_id: str = Field(foreign_key="order.id")
     
@@ -36,14 +46,50 @@ class OrderBase(SQLModel):
     currency: str = "USD"
     status: OrderStatus = Field(default=OrderStatus.PENDING)
     pdf_url: Optional[str] = None
+    # Orders that predate the invoice queue already had their PDF rendered at checkout
+    invoice_status: str = Field(default=InvoiceStatus.PENDING.value, sa_column_kwargs={"server_default": InvoiceStatus.READY.value})
 
 class Order(OrderBase, table=True):
+    __table_args__ = (
+        Index("ix_order_created_at_id", "created_at", "id"),
+        Index("ix_order_user_id_created_at", "user_id", "created_at"),
+    )
+
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     payment_id: Optional[str] = None
     
-    items: List[OrderItem] = Relationship(back_populates="order")
+    # raise: AsyncSession can't lazy load, so every read path loads items explicitly
+    # (selectinload / set_committed_value) and a forgotten one fails loudly
+    items: List[OrderItem] = Relationship(back_populates="order", sa_relationship_kwargs={"lazy": "raise"})
+
+# Finished orders past ORDER_ARCHIVE_AFTER_DAYS are moved here by the archive job
+# (see archive_service) so the hot tables stay small. Same columns, same ids.
+
+class ArchivedOrderItem(OrderItemBase, table=True):
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    order_id: str = Field(foreign_key="archivedorder.id", index=True)
+
+    order: "ArchivedOrder" = Relationship(back_populates="items")
+
+class ArchivedOrder(OrderBase, table=True):
+    __table_args__ = (Index("ix_archivedorder_user_id_created_at", "user_id", "created_at"),)
+
+    id: str = Field(primary_key=True)
+    created_at: datetime
+    updated_at: datetime
+    payment_id: Optional[str] = None
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+    items: List[ArchivedOrderItem] = Relationship(back_populates="order", sa_relationship_kwargs={"lazy": "raise"})
+
+class ProductPurchase(SQLModel, table=True):
+    # One row per customer and product they ever bought, written at checkout. Review
+    # purchase checks are a primary key lookup here; archiving orders leaves it alone.
+    user_id: str = Field(primary_key=True)
+    product_id: str = Field(primary_key=True)
+    first_purchased_at: datetime = Field(default_factory=datetime.utcnow)
 
 class OrderRead(OrderBase):
     id: str
@@ -54,3 +100,12 @@ class OrderRead(OrderBase):
 
 class OrderCreate(OrderBase):
     items: List[OrderItemBase]
+
+class OrderItemStatusUpdate(SQLModel):
+    order_id: str
+    product_id: str
+    status: str
+
+class OrderItemStatusResult(OrderItemStatusUpdate):
+    updated: bool
+    error: Optional[str] = None
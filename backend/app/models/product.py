@@ -2,7 +2,7 @@ from typing import List, Optional
 from sqlmodel import SQLModel, Field
 from datetime import datetime
 import uuid
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, Column, Index
 
 class ProductBase(SQLModel):
     name: str
@@ -17,9 +17,27 @@ class ProductBase(SQLModel):
     category: str
 
 class Product(ProductBase, table=True):
+    # Back the (created_at, id) keyset pagination of the catalog listing and its filters.
+    # The FULLTEXT/FTS5 search index is dialect specific, see services/search_service.py
+    __table_args__ = (
+        Index("ix_product_created_at_id", "created_at", "id"),
+        Index("ix_product_category_created_at_id", "category", "created_at", "id"),
+        Index("ix_product_price", "price"),
+    )
+
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+    # Review aggregates, maintained by ReviewService (rebuild: python manage.py rebuild-ratings).
+    # Average is rating_sum / rating_count; rating_1..rating_5 are the star histogram.
+    rating_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_sum: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_1: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_2: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_3: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_4: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    rating_5: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
 class ProductCreate(ProductBase):
     pass
@@ -1,16 +1,30 @@
 from sqlmodel import SQLModel, Field
 from datetime import datetime
+from enum import Enum
 from typing import List, Optional
 import uuid
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, Column, Index
+
+class ReviewSort(str, Enum):
+    NEWEST = "newest"
+    HIGHEST = "highest"
+    LOWEST = "lowest"
 
 class ReviewBase(SQLModel):
-    product_id: str = Field(index=True)
+    product_id: str
     rating: int
     comment: str
     images: List[str] = Field(default=[], sa_column=Column(JSON))
 
 class Review(ReviewBase, table=True):
+    __table_args__ = (
+        # One review per customer and product; create_review upserts on it
+        Index("ix_review_product_id_user_id", "product_id", "user_id", unique=True),
+        # Keyset pagination for each ReviewSort
+        Index("ix_review_product_id_created_at_id", "product_id", "created_at", "id"),
+        Index("ix_review_product_id_rating_created_at_id", "product_id", "rating", "created_at", "id"),
+    )
+
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     user_id: str
     user_name: str
@@ -0,0 +1,90 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import insert, delete, literal
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.tasks import ServiceTasks, run_periodically
+from app.models.order import Order, OrderItem, OrderStatus, ArchivedOrder, ArchivedOrderItem
+
+logger = logging.getLogger(__name__)
+
+ARCHIVABLE_STATUSES = [OrderStatus.COMPLETED, OrderStatus.CANCELLED]
+
+class ArchiveService:
+    """Moves finished orders out of the hot order/orderitem tables.
+
+    Works in chunks of ORDER_ARCHIVE_BATCH_SIZE orders, oldest first, each chunk its
+    own transaction: copy with INSERT ... SELECT, then delete from the hot tables.
+    Reads fall back to the archive (see OrderService), so archiving is invisible to
+    customers; archived orders are read only.
+    """
+
+    def __init__(self):
+        self._tasks = ServiceTasks()
+
+    async def archive_orders(self, db: AsyncSession, older_than: datetime, batch_size: Optional[int] = None) -> int:
+        batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+        archived = 0
+        while True:
+            statement = (
+                select(Order.id)
+                .where(Order.created_at < older_than, Order.status.in_(ARCHIVABLE_STATUSES))
+                .order_by(Order.created_at)
+                .limit(batch_size)
+            )
+            order_ids = (await db.exec(statement)).all()
+            if not order_ids:
+                return archived
+            try:
+                await self._move(db, order_ids)
+            except IntegrityError:
+                # Another worker archived (some of) this chunk first; leave the rest to the next run
+                await db.rollback()
+                logger.info("Archive chunk raced with another worker, stopping this run")
+                return archived
+            archived += len(order_ids)
+
+    async def _move(self, db: AsyncSession, order_ids: list):
+        now = datetime.utcnow()
+        order_columns = [c.name for c in Order.__table__.columns]
+        item_columns = [c.name for c in OrderItem.__table__.columns]
+        # Status is checked again so an order reopened since the SELECT stays put
+        moved = Order.id.in_(order_ids) & Order.status.in_(ARCHIVABLE_STATUSES)
+
+        await db.exec(insert(ArchivedOrder).from_select(
+            order_columns + ["archived_at"],
+            select(*[Order.__table__.c[name] for name in order_columns], literal(now)).where(moved),
+        ))
+        await db.exec(insert(ArchivedOrderItem).from_select(
+            item_columns,
+            select(*[OrderItem.__table__.c[name] for name in item_columns]).where(
+                OrderItem.order_id.in_(select(ArchivedOrder.id).where(ArchivedOrder.id.in_(order_ids)))
+            ),
+        ))
+        archived_ids = select(ArchivedOrder.id).where(ArchivedOrder.id.in_(order_ids))
+        await db.exec(delete(OrderItem).where(OrderItem.order_id.in_(archived_ids)))
+        await db.exec(delete(Order).where(Order.id.in_(archived_ids)))
+        await db.commit()
+
+    async def run_once(self) -> int:
+        if settings.ORDER_ARCHIVE_AFTER_DAYS <= 0:
+            return 0
+        older_than = datetime.utcnow() - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+        async with async_session() as db:
+            archived = await self.archive_orders(db, older_than)
+        if archived:
+            logger.info("Archived %s orders older than %s", archived, older_than)
+        return archived
+
+    def start(self):
+        self._tasks.start(run_periodically(self.run_once, settings.ORDER_ARCHIVE_INTERVAL_SECONDS, "Order archival"))
+
+    async def stop(self):
+        await self._tasks.stop()
+
+archive_service = ArchiveService()
@@ -1,87 +1,207 @@
-from typing import Dict, Any, Optional
-from sqlmodel import Session, select
-from app.models.cart import Cart, CartItem
+import logging
+from typing import Dict, Any, List, Optional
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlmodel import select, delete, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.tasks import ServiceTasks, run_periodically
+from app.models.cart import Cart, CartItem, CartItemBase, CartRead, CartOperation, CartOperationType
+from app.services.cart_store import cart_store, load_cart, write_carts
+
+logger = logging.getLogger(__name__)
 
 class CartService:
-    def get_cart(self, db: Session, user_id: str) -> Cart:
-        statement = select(Cart).where(Cart.user_id == user_id)
-        cart = db.exec(statement).first()
-        if not cart:
-            # Create empty cart if not exists
-            cart = Cart(user_id=user_id)
-            db.add(cart)
-            db.commit()
-            db.refresh(cart)
+    """Cart operations against the live cart in the cart store (see cart_store.py).
+
+    Changes to one user's cart are serialized by the store's per-user lock (shared
+    by all workers for Redis), which checkout also holds, so checkout sees exactly
+    the cart the last operation left behind.
+    """
+
+    def __init__(self):
+        self._tasks = ServiceTasks()
+
+    def locked(self, user_id: str):
+        return cart_store.lock(user_id)
+
+    async def get_cart(self, db: AsyncSession, user_id: str) -> CartRead:
+        cart = await cart_store.get(user_id)
+        if cart is None:
+            cart = await load_cart(db, user_id)
+            await cart_store.put(db, cart, dirty=False)
         return cart
 
-    def add_item(self, db: Session, user_id: str, item_dict: Dict[str, Any]) -> Cart:
-        cart = self.get_cart(db, user_id)
-        
-        # Check if item exists in cart
-        existing_item = next((i for i in cart.items if i.product_id == item_dict["product_id"]), None)
-        
-        if existing_item:
-            existing_item.quantity += item_dict["quantity"]
-            db.add(existing_item)
-        else:
-            new_item = CartItem(
-                cart_id=cart.id,
-                product_id=item_dict["product_id"],
-                quantity=item_dict["quantity"],
+    async def add_item(self, db: AsyncSession, user_id: str, item_dict: Dict[str, Any]) -> CartRead:
+        async with self.locked(user_id):
+            cart = await self.get_cart(db, user_id)
+            self._add(cart, item_dict)
+            return await self.save_cart(db, cart)
+
+    async def update_item_quantity(self, db: AsyncSession, user_id: str, product_id: str, quantity: int) -> CartRead:
+        async with self.locked(user_id):
+            cart = await self.get_cart(db, user_id)
+            if self._set(cart, product_id, quantity):
+                await self.save_cart(db, cart)
+            return cart
+
+    async def remove_item(self, db: AsyncSession, user_id: str, product_id: str) -> CartRead:
+        async with self.locked(user_id):
+            cart = await self.get_cart(db, user_id)
+            if self._remove(cart, product_id):
+                await self.save_cart(db, cart)
+            return cart
+
+    async def apply_operations(self, db: AsyncSession, user_id: str, operations: List[CartOperation]) -> CartRead:
+        """Applies add/set/remove operations in order, as one write with one total update."""
+        for index, op in enumerate(operations):
+            if op.op == CartOperationType.ADD and (op.quantity is None or op.quantity <= 0):
+                raise HTTPException(status_code=400, detail=f"Operation {index}: add needs a positive quantity")
+            if op.op == CartOperationType.SET and op.quantity is None:
+                raise HTTPException(status_code=400, detail=f"Operation {index}: set needs a quantity")
+
+        async with self.locked(user_id):
+            cart = await self.get_cart(db, user_id)
+            for op in operations:
+                if op.op == CartOperationType.ADD:
+                    self._add(cart, op.model_dump(exclude={"op"}))
+                elif op.op == CartOperationType.SET:
+                    self._set(cart, op.product_id, op.quantity)
+                else:
+                    self._remove(cart, op.product_id)
+            return await self.save_cart(db, cart)
+
+    async def clear_cart(self, db: AsyncSession, user_id: str):
+        # Set-based: no need to load the cart or its items first. Runs in the caller's
+        # transaction; call cart_cleared() once that has committed.
+        cart_id = select(Cart.id).where(Cart.user_id == user_id).scalar_subquery()
+        await db.exec(delete(CartItem).where(CartItem.cart_id == cart_id))
+        await db.exec(update(Cart).where(Cart.user_id == user_id).values(total=0.0))
+
+    async def cart_cleared(self, db: AsyncSession, user_id: str):
+        # Dirty on purpose: a flush that read the old contents before the clear
+        # committed gets overwritten by the next one
+        cart = await self.get_cart(db, user_id)
+        cart.items = []
+        cart.total = 0.0
+        await cart_store.put(db, cart)
+
+    async def flush(self) -> int:
+        """Writes dirty carts from the cart store to the database."""
+        flushed = 0
+        while True:
+            carts = await cart_store.take_dirty(settings.CART_FLUSH_BATCH_SIZE)
+            if not carts:
+                return flushed
+            try:
+                async with async_session() as db:
+                    await write_carts(db, carts)
+            except Exception:
+                logger.warning("Writing %s carts failed, retrying them one at a time", len(carts), exc_info=True)
+                await self._write_each(carts)
+            flushed += len(carts)
+
+    async def _write_each(self, carts: List[CartRead]):
+        # Finds the cart(s) that broke a batch so they can't fail every later flush too.
+        # If the database itself is down, everything stays dirty for the next interval.
+        for index, cart in enumerate(carts):
+            try:
+                async with async_session() as db:
+                    await write_carts(db, [cart])
+            except Exception:
+                if not await self._database_reachable():
+                    await cart_store.mark_dirty([c.user_id for c in carts[index:]])
+                    raise
+                logger.exception("Dropping cart for user %s that can't be written: %s", cart.user_id, cart.model_dump_json())
+                await cart_store.discard(cart.user_id)
+
+    async def _database_reachable(self) -> bool:
+        try:
+            async with async_session() as db:
+                await db.exec(select(1))
+            return True
+        except Exception:
+            return False
+
+    def start(self):
+        self._tasks.start(run_periodically(self.flush, settings.CART_FLUSH_INTERVAL_SECONDS, "Cart flush", delay_first=True))
+
+    async def stop(self):
+        await self._tasks.stop()
+        # Whatever changed since the last interval
+        await self.flush()
+        await cart_store.close()
+
+    def _find(self, cart: CartRead, product_id: str) -> Optional[CartItemBase]:
+        return next((i for i in cart.items if i.product_id == product_id), None)
+
+    # Totals move by the delta of each change, no pass over the other items
+
+    def _add(self, cart: CartRead, item_dict: Dict[str, Any]):
+        try:
+            item = CartItemBase(
+                product_id=item_dict.get("product_id"),
+                quantity=item_dict.get("quantity"),
                 product_name=item_dict.get("product_name"),
                 price=item_dict.get("price"),
                 image=item_dict.get("image")
             )
-            db.add(new_item)
-        
-        db.commit()
-        db.refresh(cart)
-        self._recalculate_total(db, cart)
-        return cart
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cart item: {e.errors()[0]['msg']}")
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantity must be positive")
 
-    def update_item_quantity(self, db: Session, user_id: str, product_id: str, quantity: int) -> Cart:
-        cart = self.get_cart(db, user_id)
-        item = next((i for i in cart.items if i.product_id == product_id), None)
-        
-        if item:
-            if quantity <= 0:
-                 db.delete(item)
-            else:
-                item.quantity = quantity
-                db.add(item)
-            db.commit()
-            db.refresh(cart)
-            self._recalculate_total(db, cart)
-            
-        return cart
+        existing_item = self._find(cart, item.product_id)
+        if existing_item:
+            existing_item.quantity += item.quantity
+            self._adjust_total(cart, item.quantity * (existing_item.price or 0.0))
+        else:
+            cart.items.append(item)
+            self._adjust_total(cart, item.quantity * (item.price or 0.0))
+
+    def _set(self, cart: CartRead, product_id: str, quantity: int) -> bool:
+        item = self._find(cart, product_id)
+        if not item:
+            return False
+        if quantity <= 0:
+            cart.items.remove(item)
+            quantity = 0
+        self._adjust_total(cart, (quantity - item.quantity) * (item.price or 0.0))
+        item.quantity = quantity
+        return True
+
+    def _remove(self, cart: CartRead, product_id: str) -> bool:
+        item = self._find(cart, product_id)
+        if not item:
+            return False
+        cart.items.remove(item)
+        self._adjust_total(cart, -item.quantity * (item.price or 0.0))
+        return True
 
-    def remove_item(self, db: Session, user_id: str, product_id: str) -> Cart:
-        cart = self.get_cart(db, user_id)
-        item = next((i for i in cart.items if i.product_id == product_id), None)
-        
-        if item:
-            db.delete(item)
-            db.commit()
-            db.refresh(cart)
-            self._recalculate_total(db, cart)
-            
+    def _adjust_total(self, cart: CartRead, delta: float):
+        # Rounded to cents so repeated deltas don't drift
+        cart.total = round(cart.total + delta, 2) if cart.items else 0.0
+
+    async def save_cart(self, db: AsyncSession, cart: CartRead) -> CartRead:
+        await cart_store.put(db, cart)
         return cart
 
-    def clear_cart(self, db: Session, user_id: str):
-        cart = self.get_cart(db, user_id)
+    def revalidate_prices(self, cart: CartRead, prices: Dict[str, float]) -> bool:
+        """Brings item prices in line with the catalog (product_id -> current price).
+
+        Prices in the cart are whatever the client sent when adding, so checkout calls
+        this with the products it has already loaded. Only changes `cart`; returns True
+        if anything changed, and the caller decides when to store it.
+        """
+        changed = False
         for item in cart.items:
-            db.delete(item)
-        cart.total = 0.0
-        db.add(cart)
-        db.commit()
-        db.refresh(cart)
-
-    def _recalculate_total(self, db: Session, cart: Cart):
-        # Calculate total
-        total = sum(i.quantity * (i.price or 0.0) for i in cart.items)
-        cart.total = total
-        db.add(cart)
-        db.commit()
-        db.refresh(cart)
+            price = prices.get(item.product_id)
+            if price is not None and item.price != price:
+                item.price = price
+                changed = True
+        if changed:
+            cart.total = round(sum(i.quantity * (i.price or 0.0) for i in cart.items), 2)
+        return changed
 
 cart_service = CartService()
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List, Optional, Set
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert, update, delete
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models.cart import Cart, CartItem, CartItemBase, CartRead
+
+logger = logging.getLogger(__name__)
+
+# Where live carts are kept (CART_STORE_URL). The key-value stores are write-behind:
+# put() only marks a cart dirty and CartService flushes dirty carts to the cart and
+# cartitem tables in batches. The database stays the durable copy and is read on a miss.
+
+async def load_cart(db: AsyncSession, user_id: str) -> CartRead:
+    statement = select(Cart).where(Cart.user_id == user_id).options(selectinload(Cart.items))
+    cart = (await db.exec(statement)).first()
+    if not cart:
+        # Not written anywhere until something is put in it
+        return CartRead(id=str(uuid.uuid4()), user_id=user_id, total=0.0, items=[])
+    return CartRead(
+        id=cart.id,
+        user_id=cart.user_id,
+        total=cart.total,
+        items=[CartItemBase.model_validate(item, from_attributes=True) for item in cart.items],
+    )
+
+async def write_carts(db: AsyncSession, carts: List[CartRead]):
+    """Replaces the stored rows of these carts with their current contents, in one transaction."""
+    rows = await db.exec(select(Cart.user_id, Cart.id).where(Cart.user_id.in_([c.user_id for c in carts])))
+    cart_ids = dict(rows.all())
+
+    existing = [{"id": cart_ids[c.user_id], "total": c.total} for c in carts if c.user_id in cart_ids]
+    if existing:
+        # ORM bulk UPDATE by primary key: one executemany
+        await db.exec(update(Cart), params=existing)
+    new_carts = [c for c in carts if c.user_id not in cart_ids]
+    if new_carts:
+        await db.exec(insert(Cart), params=[{"id": c.id, "user_id": c.user_id, "total": c.total} for c in new_carts])
+        cart_ids.update((c.user_id, c.id) for c in new_carts)
+
+    await db.exec(delete(CartItem).where(CartItem.cart_id.in_(list(cart_ids.values()))))
+    items = [dict(item.model_dump(), cart_id=cart_ids[c.user_id]) for c in carts for item in c.items]
+    if items:
+        await db.exec(insert(CartItem), params=items)
+    await db.commit()
+
+def decode_cart(user_id: str, raw) -> Optional[CartRead]:
+    # A stored cart that no longer validates is dropped by the caller rather than
+    # failing every read (and every flush) for that user from then on
+    try:
+        return CartRead.model_validate_json(raw)
+    except ValidationError:
+        logger.exception("Dropping undecodable cart for user %s: %r", user_id, raw)
+        return None
+
+class CartStore(ABC):
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @asynccontextmanager
+    async def lock(self, user_id: str):
+        """Serializes read-modify-write of one user's cart. In-process here, which is
+        enough for stores a single worker owns (or that write through to the database)."""
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        async with lock:
+            yield
+
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[CartRead]:
+        """The live cart, or None if this store doesn't have it (load it from the database)."""
+
+    @abstractmethod
+    async def put(self, db: AsyncSession, cart: CartRead, dirty: bool = True):
+        """Stores the cart; dirty ones are written to the database by the next flush."""
+
+    async def take_dirty(self, limit: int) -> List[CartRead]:
+        """Removes up to `limit` carts from the dirty set and returns their current contents."""
+        return []
+
+    async def mark_dirty(self, user_ids: List[str]):
+        pass
+
+    async def discard(self, user_id: str):
+        """Forgets the live cart; the next read loads the database copy."""
+
+    async def close(self):
+        pass
+
+class DatabaseCartStore(CartStore):
+    # Write-through: every change is committed to the cart tables right away
+    async def get(self, user_id: str) -> Optional[CartRead]:
+        return None
+
+    async def put(self, db: AsyncSession, cart: CartRead, dirty: bool = True):
+        if dirty:
+            await write_carts(db, [cart])
+
+class MemoryCartStore(CartStore):
+    # Single process only. Carts are kept serialized so callers never share objects;
+    # beyond maxsize the least recently used clean carts are dropped.
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+        self._carts: "OrderedDict[str, str]" = OrderedDict()
+        self._dirty: Set[str] = set()
+
+    async def get(self, user_id: str) -> Optional[CartRead]:
+        raw = self._carts.get(user_id)
+        if raw is None:
+            return None
+        cart = decode_cart(user_id, raw)
+        if cart is None:
+            await self.discard(user_id)
+            return None
+        self._carts.move_to_end(user_id)
+        return cart
+
+    async def put(self, db: AsyncSession, cart: CartRead, dirty: bool = True):
+        self._carts[cart.user_id] = cart.model_dump_json()
+        self._carts.move_to_end(cart.user_id)
+        if dirty:
+            self._dirty.add(cart.user_id)
+        excess = len(self._carts) - self.maxsize
+        if excess > 0:
+            # Dirty carts stay until flushed
+            evict = []
+            for user_id in self._carts:
+                if user_id not in self._dirty:
+                    evict.append(user_id)
+                    if len(evict) == excess:
+                        break
+            for user_id in evict:
+                del self._carts[user_id]
+
+    async def take_dirty(self, limit: int) -> List[CartRead]:
+        user_ids = [self._dirty.pop() for _ in range(min(limit, len(self._dirty)))]
+        carts = []
+        try:
+            for user_id in user_ids:
+                cart = decode_cart(user_id, self._carts[user_id])
+                if cart is None:
+                    await self.discard(user_id)
+                else:
+                    carts.append(cart)
+        except BaseException:
+            self._dirty.update(u for u in user_ids if u in self._carts)
+            raise
+        return carts
+
+    async def mark_dirty(self, user_ids: List[str]):
+        self._dirty.update(u for u in user_ids if u in self._carts)
+
+    async def discard(self, user_id: str):
+        self._carts.pop(user_id, None)
+        self._dirty.discard(user_id)
+
+class RedisCartStore(CartStore):
+    # Shared by every app worker; works with anything speaking the Redis protocol
+    DIRTY_KEY = "carts:dirty"
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("CART_STORE_URL points at Redis but the 'redis' package is not installed")
+        super().__init__()
+        self._redis = redis.Redis.from_url(url)
+
+    def _lock_key(self, user_id: str) -> str:
+        return f"cart-lock:{user_id}"
+
+    @asynccontextmanager
+    async def lock(self, user_id: str):
+        # Every worker shares these carts, so the lock lives in Redis too (SET NX PX
+        # with a token, released only by its owner). The in-process lock in front
+        # keeps it to one Redis waiter per worker.
+        from redis.exceptions import LockError
+
+        async with super().lock(user_id):
+            lock = self._redis.lock(
+                self._lock_key(user_id),
+                timeout=settings.CART_LOCK_TTL_SECONDS,
+                blocking_timeout=settings.CART_LOCK_WAIT_SECONDS,
+                thread_local=False,  # Tasks share the event loop's thread
+            )
+            if not await lock.acquire():
+                raise HTTPException(status_code=409, detail="Cart is being updated, please retry")
+            try:
+                yield
+            finally:
+                try:
+                    await lock.release()
+                except LockError:
+                    logger.warning("Cart lock for user %s expired before it was released", user_id)
+
+    def _key(self, user_id: str) -> str:
+        return f"cart:{user_id}"
+
+    async def get(self, user_id: str) -> Optional[CartRead]:
+        raw = await self._redis.get(self._key(user_id))
+        if raw is None:
+            return None
+        cart = decode_cart(user_id, raw)
+        if cart is None:
+            await self.discard(user_id)
+        return cart
+
+    async def put(self, db: AsyncSession, cart: CartRead, dirty: bool = True):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._key(cart.user_id), cart.model_dump_json(), ex=settings.CART_STORE_TTL_SECONDS)
+            if dirty:
+                pipe.sadd(self.DIRTY_KEY, cart.user_id)
+            await pipe.execute()
+
+    async def take_dirty(self, limit: int) -> List[CartRead]:
+        user_ids = [u.decode() for u in await self._redis.spop(self.DIRTY_KEY, limit) or []]
+        if not user_ids:
+            return []
+        try:
+            values = await self._redis.mget([self._key(u) for u in user_ids])
+        except BaseException:
+            await self.mark_dirty(user_ids)
+            raise
+        carts = []
+        for user_id, raw in zip(user_ids, values):
+            if raw is None:
+                continue  # Expired
+            cart = decode_cart(user_id, raw)
+            if cart is None:
+                await self.discard(user_id)
+            else:
+                carts.append(cart)
+        return carts
+
+    async def mark_dirty(self, user_ids: List[str]):
+        if user_ids:
+            await self._redis.sadd(self.DIRTY_KEY, *user_ids)
+
+    async def discard(self, user_id: str):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._key(user_id))
+            pipe.srem(self.DIRTY_KEY, user_id)
+            await pipe.execute()
+
+    async def close(self):
+        await self._redis.aclose()
+
+def create_cart_store(url: str) -> CartStore:
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCartStore(url)
+    if url == "memory://":
+        return MemoryCartStore(settings.CART_STORE_MAX_SIZE)
+    if url == "db://":
+        return DatabaseCartStore()
+    raise ValueError(f"Unsupported CART_STORE_URL: {url}")
+
+cart_store = create_cart_store(settings.CART_STORE_URL)
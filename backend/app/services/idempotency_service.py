@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional, Type
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel, select, delete, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.tasks import ServiceTasks, run_periodically
+from app.models.idempotency import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+class IdempotencyService:
+    """Replays the stored response when a client retries with the same Idempotency-Key.
+
+    The first request inserts the key row before doing any work, so a concurrent
+    duplicate gets a 409 instead of running the handler again. A failed request
+    releases its key so the client can retry it for real.
+    """
+
+    def __init__(self):
+        self._tasks = ServiceTasks()
+
+    async def run(
+        self,
+        db: AsyncSession,
+        key: Optional[str],
+        user_id: str,
+        endpoint: str,
+        payload: Any,
+        handler: Callable[[], Awaitable[Any]],
+        response_model: Type[SQLModel],
+    ) -> Any:
+        if key is None:
+            return await handler()
+        if not key or len(key) > 255:
+            raise HTTPException(status_code=400, detail="Idempotency-Key must be 1-255 characters")
+
+        request_hash = hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+        record = await self._begin(db, user_id, key, endpoint, request_hash)
+        if record is not None:
+            return JSONResponse(record.response_body, status_code=record.status_code, headers={"Idempotent-Replayed": "true"})
+
+        try:
+            result = await handler()
+        except Exception:
+            await self._release(db, user_id, key)
+            raise
+        body = jsonable_encoder(response_model.model_validate(result))
+        await db.exec(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .values(status_code=200, response_body=body)
+        )
+        await db.commit()
+        return result
+
+    async def _begin(self, db: AsyncSession, user_id: str, key: str, endpoint: str, request_hash: str) -> Optional[IdempotencyKey]:
+        """Returns the completed record to replay, or None once this request owns the key."""
+        now = datetime.utcnow()
+        statement = select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        record = (await db.exec(statement)).first()
+        if record is not None:
+            stale_lock = record.status_code is None and record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT_SECONDS)
+            if record.expires_at > now and not stale_lock:
+                if record.endpoint != endpoint or record.request_hash != request_hash:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+                if record.status_code is None:
+                    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+                return record
+            # Expired, or its request died mid-flight: take the key over
+            db.expunge(record)
+            await db.exec(delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.created_at == record.created_at,
+            ))
+
+        db.add(IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            endpoint=endpoint,
+            request_hash=request_hash,
+            created_at=now,
+            expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+        ))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Lost the race to a concurrent request with the same key
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        return None
+
+    async def _release(self, db: AsyncSession, user_id: str, key: str):
+        await db.rollback()
+        await db.exec(delete(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.status_code.is_(None),
+        ))
+        await db.commit()
+
+    async def purge_expired(self, db: AsyncSession) -> int:
+        result = await db.exec(delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow()))
+        await db.commit()
+        return result.rowcount
+
+    async def _purge(self):
+        async with async_session() as db:
+            purged = await self.purge_expired(db)
+        if purged:
+            logger.info("Purged %s expired idempotency keys", purged)
+
+    def start(self):
+        self._tasks.start(run_periodically(self._purge, settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS, "Idempotency key purge"))
+
+    async def stop(self):
+        await self._tasks.stop()
+
+idempotency_service = IdempotencyService()
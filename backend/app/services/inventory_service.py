@@ -1,24 +1,44 @@
-from sqlmodel import Session
+from datetime import datetime
+from sqlmodel import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.models.product import Product
+from app.services.product_service import product_service
 
 class InventoryService:
-    def get_stock(self, db: Session, product_id: str) -> int:
-        product = db.get(Product, product_id)
+    async def get_stock(self, db: AsyncSession, product_id: str) -> int:
+        product = await db.get(Product, product_id)
         return product.stock if product else 0
 
-    def adjust_stock(self, db: Session, product_id: str, adjustment: int, reason: str = "Manual adjustment", author_name: str = "System") -> int:
-        product = db.get(Product, product_id)
-        if not product:
-             raise ValueError("Product not found")
-        
-        new_qty = product.stock + adjustment
-        if new_qty < 0:
+    async def reserve_stock(self, db: AsyncSession, product_id: str, quantity: int) -> bool:
+        # Check and decrement in one statement so concurrent checkouts can't oversell.
+        # Does not commit: the caller owns the transaction (and the row lock it now holds).
+        statement = (
+            update(Product)
+            .where(Product.id == product_id, Product.stock >= quantity)
+            .values(stock=Product.stock - quantity, updated_at=datetime.utcnow())
+        )
+        result = await db.exec(statement)
+        return result.rowcount == 1
+
+    async def adjust_stock(self, db: AsyncSession, product_id: str, adjustment: int, reason: str = "Manual adjustment", author_name: str = "System") -> int:
+        statement = (
+            update(Product)
+            .where(Product.id == product_id)
+            .values(stock=Product.stock + adjustment, updated_at=datetime.utcnow())
+        )
+        if adjustment < 0:
+            statement = statement.where(Product.stock >= -adjustment)
+        result = await db.exec(statement)
+        if result.rowcount != 1:
+            await db.rollback()
+            if not await db.get(Product, product_id):
+                raise ValueError("Product not found")
             raise ValueError("Insufficient stock")
-            
-        product.stock = new_qty
-        db.add(product)
-        db.commit()
-        db.refresh(product)
-        return product.stock
+
+        # Read inside the transaction, the row is still locked by our UPDATE
+        new_qty = (await db.exec(select(Product.stock).where(Product.id == product_id))).one()
+        await db.commit()
+        product_service.invalidate(product_id)
+        return new_qty
 
 inventory_service = InventoryService()
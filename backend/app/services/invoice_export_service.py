@@ -0,0 +1,168 @@
+import asyncio
+import multiprocessing
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from sqlmodel import select
+from sqlalchemy import exists, literal, union_all
+from sqlalchemy.orm import noload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.pagination import after_cursor
+from app.models.billing import Invoice
+from app.models.order import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from app.models.user import User
+from app.services.invoice_service import invoice_pdf_cache
+from app.services.pdf_service import pdf_service, render_invoice
+
+class _ZipStream:
+    """Write-only sink for ZipFile; the bytes written so far are drained after each entry.
+
+    It has no seek/tell, so zipfile writes data descriptors instead of seeking back.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class InvoiceExportService:
+    """Streams a seller's invoices for a date range as a ZIP archive, archived orders included.
+
+    PDFs render in a process pool (FPDF layout is CPU bound and holds the GIL).
+    At most INVOICE_EXPORT_PROCESSES * 2 renders are in flight and every finished
+    PDF is written to the archive and sent straight away, so memory stays flat
+    however many invoices the range covers.
+    """
+
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Not fork: the server process already runs threads (thread pools, aiosqlite)
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.INVOICE_EXPORT_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _page_ids(self, model, item_model, seller_id: str, start: datetime, end: datetime, last: Optional[list]):
+        statement = (
+            select(model.id, model.created_at, literal(model is ArchivedOrder).label("archived"))
+            .join(Invoice, Invoice.order_id == model.id)
+            .where(
+                model.created_at >= start,
+                model.created_at < end,
+                exists().where(item_model.order_id == model.id, item_model.seller_id == seller_id),
+            )
+            .order_by(model.created_at, model.id)
+            .limit(settings.INVOICE_EXPORT_BATCH_SIZE)
+        )
+        if last is not None:
+            statement = statement.where(after_cursor([model.created_at, model.id], last, descending=False))
+        return statement
+
+    async def _pages(self, db, seller_id: str, start: datetime, end: datetime) -> AsyncIterator[list]:
+        # Keyset pages over buffered results rather than one streamed result: MySQL
+        # can't run the items query on a connection with an unbuffered result open.
+        # Hot and archived orders are paged together, as in order_service.list_user_orders.
+        last = None
+        while True:
+            merged = union_all(
+                self._page_ids(Order, OrderItem, seller_id, start, end, last).subquery().select(),
+                self._page_ids(ArchivedOrder, ArchivedOrderItem, seller_id, start, end, last).subquery().select(),
+            ).subquery()
+            statement = (
+                select(merged.c.id, merged.c.archived)
+                .order_by(merged.c.created_at, merged.c.id)
+                .limit(settings.INVOICE_EXPORT_BATCH_SIZE)
+            )
+            page_ids = (await db.exec(statement)).all()
+            if not page_ids:
+                return
+
+            # Then the page's invoices and orders, and their items, with one query per table
+            found = {}
+            for model, item_model, archived in ((Order, OrderItem, False), (ArchivedOrder, ArchivedOrderItem, True)):
+                ids = [order_id for order_id, is_archived in page_ids if bool(is_archived) == archived]
+                if not ids:
+                    continue
+                statement = (
+                    select(Invoice, model, User.email)
+                    .join(model, model.id == Invoice.order_id)
+                    .outerjoin(User, User.id == model.user_id)
+                    .where(model.id.in_(ids))
+                    .options(noload(model.items))
+                )
+                rows = (await db.exec(statement)).all()
+                items_by_order = {order.id: [] for _, order, _ in rows}
+                items = await db.exec(select(item_model).where(item_model.order_id.in_(ids)).order_by(item_model.id))
+                for item in items.all():
+                    items_by_order[item.order_id].append(item)
+                for row in rows:
+                    set_committed_value(row[1], "items", items_by_order[row[1].id])
+                    found[row[1].id] = row
+            rows = [found[order_id] for order_id, _ in page_ids if order_id in found]
+
+            yield rows
+            last = [rows[-1][1].created_at, rows[-1][1].id]
+            # Each page is done with once yielded; keep the session from holding them all
+            db.expunge_all()
+
+    async def export_invoices(self, seller_id: str, start: datetime, end: datetime) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        window = settings.INVOICE_EXPORT_PROCESSES * 2
+        pending = deque()
+        sink = _ZipStream()
+
+        def write_entry(order_id: str, content: bytes):
+            archive.writestr(f"invoice_{order_id}.pdf", content)
+
+        # StreamingResponse consumes this after the request scope (and its session) has ended
+        async with async_session() as db:
+            with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                async for rows in self._pages(db, seller_id, start, end):
+                    for invoice, order, email in rows:
+                        cached = invoice_pdf_cache.get(invoice.id)
+                        if cached is not None:
+                            future = loop.create_future()
+                            future.set_result(cached)
+                        else:
+                            data = pdf_service.invoice_data(invoice, order, user_email=email or order.user_id)
+                            future = loop.run_in_executor(pool, render_invoice, data)
+                        pending.append((order.id, future))
+
+                        if len(pending) >= window:
+                            order_id, future = pending.popleft()
+                            write_entry(order_id, await future)
+                            yield sink.drain()
+
+                while pending:
+                    order_id, future = pending.popleft()
+                    write_entry(order_id, await future)
+                    yield sink.drain()
+            # Central directory
+            yield sink.drain()
+
+invoice_export_service = InvoiceExportService()
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import selectinload
+from sqlmodel import select, update, or_, and_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from fastapi import HTTPException
+
+from app.core import events
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.tasks import ServiceTasks
+from app.models.billing import Invoice, InvoiceJob, InvoiceJobStatus, InvoiceStatus
+from app.models.order import Order, ArchivedOrder
+from app.services.pdf_service import pdf_service, render_invoice
+from app.services.user_service import user_service
+
+logger = logging.getLogger(__name__)
+
+# Rendered PDFs keyed by invoice id; invoices don't change once issued
+invoice_pdf_cache = TTLCache(
+    "invoice_pdfs",
+    maxsize=settings.INVOICE_PDF_CACHE_MAX_ITEMS,
+    ttl=settings.INVOICE_PDF_CACHE_TTL_SECONDS,
+    maxbytes=settings.INVOICE_PDF_CACHE_MAX_BYTES,
+)
+
+class InvoicePending(Exception):
+    """A worker is rendering the invoice right now; ask again shortly."""
+
+class InvoiceService:
+    """Renders invoice PDFs from a DB-backed job queue, off the checkout path.
+
+    PDFs are rendered in memory and kept in a bounded LRU cache; writing them to
+    UPLOAD_DIR is optional (INVOICE_PDF_PERSIST) and a missing file is simply
+    rendered again from the Order and Invoice rows.
+
+    Checkout inserts an InvoiceJob in its own transaction. Workers (asyncio tasks
+    started with the app) claim jobs with a conditional UPDATE, so a job is rendered
+    by exactly one worker or by an on-demand download, never twice at once.
+    """
+
+    def __init__(self):
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks = ServiceTasks()
+
+    def enqueue(self, db: AsyncSession, invoice: Invoice) -> InvoiceJob:
+        # Added to the caller's session; becomes visible when the caller commits
+        job = InvoiceJob(invoice_id=invoice.id, order_id=invoice.order_id)
+        db.add(job)
+        return job
+
+    def notify(self):
+        # Lets idle workers pick a fresh job up now rather than at the next poll
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def get_job(self, db: AsyncSession, order_id: str) -> Optional[InvoiceJob]:
+        statement = select(InvoiceJob).where(InvoiceJob.order_id == order_id).order_by(InvoiceJob.id.desc())
+        return (await db.exec(statement)).first()
+
+    async def claim(self, db: AsyncSession, job_id: int, include_failed: bool = False) -> bool:
+        claimable = [InvoiceJobStatus.QUEUED, InvoiceJobStatus.FAILED] if include_failed else [InvoiceJobStatus.QUEUED]
+        statement = (
+            update(InvoiceJob)
+            .where(InvoiceJob.id == job_id, InvoiceJob.status.in_(claimable))
+            .values(status=InvoiceJobStatus.RUNNING, attempts=InvoiceJob.attempts + 1, updated_at=datetime.utcnow())
+        )
+        claimed = (await db.exec(statement)).rowcount == 1
+        await db.commit()
+        return claimed
+
+    async def get_invoice(self, db: AsyncSession, order_id: str) -> Optional[Invoice]:
+        return (await db.exec(select(Invoice).where(Invoice.order_id == order_id))).first()
+
+    async def get_pdf(self, db: AsyncSession, order: Order) -> Optional[bytes]:
+        """PDF bytes for an order's invoice: memory cache, then the stored copy, else render now.
+
+        Raises InvoicePending while a worker holds the job.
+        """
+        invoice = await self.get_invoice(db, order.id)
+        if not invoice:
+            return None
+        content = invoice_pdf_cache.get(invoice.id)
+        if content is not None:
+            return content
+        if invoice.pdf_url:
+            try:
+                content = await run_in_threadpool(pdf_service.load_invoice_pdf, invoice.id)
+                invoice_pdf_cache.set(invoice.id, content)
+                return content
+            except FileNotFoundError:
+                logger.warning("Invoice PDF for order %s missing on disk, regenerating", order.id)
+
+        # Not rendered yet, or the stored copy is gone: rebuild it from the rows.
+        # Taking the queued job (if any) spares the workers a second render.
+        job = await self.get_job(db, order.id)
+        if job and await self.claim(db, job.id, include_failed=True):
+            content = await self.render(db, job.id)
+            if content is None:
+                raise HTTPException(status_code=500, detail="Invoice rendering failed")
+            return content
+        if job:
+            await db.refresh(job)  # The claim lost, to whom?
+        if job and job.status == InvoiceJobStatus.RUNNING:
+            # A worker has it; don't render the same invoice alongside it
+            raise InvoicePending(order.id)
+        # Rendered before but no longer cached or stored (or from before the job queue)
+        content = await self._render(db, invoice, order)
+        order.invoice_status = InvoiceStatus.READY.value
+        await db.commit()
+        return content
+
+    async def _render(self, db: AsyncSession, invoice: Invoice, order: Order) -> bytes:
+        user = await user_service.get_user_by_id(db, order.user_id)
+        data = pdf_service.invoice_data(invoice, order, user_email=user.email if user else order.user_id)
+        # FPDF layout is CPU bound, keep it off the event loop
+        content = await run_in_threadpool(render_invoice, data)
+        invoice_pdf_cache.set(invoice.id, content)
+        if settings.INVOICE_PDF_PERSIST:
+            pdf_rel_path = await run_in_threadpool(pdf_service.save_invoice_pdf, invoice.id, content)
+            invoice.pdf_url = pdf_rel_path
+            order.pdf_url = pdf_rel_path
+        return content
+
+    async def render(self, db: AsyncSession, job_id: int) -> Optional[bytes]:
+        """Render a claimed job. Returns the PDF bytes, or None if rendering failed."""
+        # populate_existing: the claim went through a Core UPDATE, don't trust the identity map
+        job = await db.get(InvoiceJob, job_id, populate_existing=True)
+        invoice = await db.get(Invoice, job.invoice_id)
+        order = await db.get(Order, job.order_id, options=[selectinload(Order.items)])
+        if order is None:
+            order = await db.get(ArchivedOrder, job.order_id, options=[selectinload(ArchivedOrder.items)])
+        try:
+            content = await self._render(db, invoice, order)
+        except Exception as e:
+            logger.exception("Invoice render failed for order %s", job.order_id)
+            await self._record_failure(db, job, str(e))
+            return None
+
+        order.invoice_status = InvoiceStatus.READY.value
+        job.status = InvoiceJobStatus.DONE
+        job.last_error = None
+        job.updated_at = datetime.utcnow()
+        await db.commit()
+        await events.publish(events.user_channel(order.user_id), {"type": "invoice.ready", "order_id": order.id})
+        return content
+
+    async def _record_failure(self, db: AsyncSession, job: InvoiceJob, error: str):
+        job.last_error = error[:1000]
+        job.updated_at = datetime.utcnow()
+        if job.attempts >= settings.INVOICE_JOB_MAX_ATTEMPTS:
+            job.status = InvoiceJobStatus.FAILED
+            order = await db.get(Order, job.order_id) or await db.get(ArchivedOrder, job.order_id)
+            order.invoice_status = InvoiceStatus.FAILED.value
+        else:
+            # Exponential backoff before the next attempt
+            job.status = InvoiceJobStatus.QUEUED
+            job.run_after = job.updated_at + timedelta(seconds=settings.INVOICE_JOB_RETRY_SECONDS * 2 ** (job.attempts - 1))
+        await db.commit()
+
+    async def _claim_next(self, db: AsyncSession) -> Optional[int]:
+        now = datetime.utcnow()
+        lease_expired = now - timedelta(seconds=settings.INVOICE_JOB_LEASE_SECONDS)
+        statement = (
+            select(InvoiceJob.id)
+            .where(or_(
+                and_(InvoiceJob.status == InvoiceJobStatus.QUEUED, InvoiceJob.run_after <= now),
+                # A worker died mid-render: hand the job out again
+                and_(InvoiceJob.status == InvoiceJobStatus.RUNNING, InvoiceJob.updated_at < lease_expired),
+            ))
+            .order_by(InvoiceJob.id)
+            .limit(settings.INVOICE_WORKERS * 2)
+        )
+        for job_id in (await db.exec(statement)).all():
+            reclaim = update(InvoiceJob).where(
+                InvoiceJob.id == job_id,
+                InvoiceJob.status == InvoiceJobStatus.RUNNING,
+                InvoiceJob.updated_at < lease_expired,
+            ).values(status=InvoiceJobStatus.QUEUED)
+            await db.exec(reclaim)
+            if await self.claim(db, job_id):
+                return job_id
+        return None
+
+    async def _worker(self):
+        while True:
+            # Cleared before looking for work so a notify() during the render isn't lost
+            self._wakeup.clear()
+            try:
+                async with async_session() as db:
+                    job_id = await self._claim_next(db)
+                    if job_id is not None:
+                        await self.render(db, job_id)
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Invoice worker error")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.INVOICE_WORKER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks.start(*(self._worker() for _ in range(settings.INVOICE_WORKERS)))
+
+    async def stop(self):
+        await self._tasks.stop()
+
+invoice_service = InvoiceService()
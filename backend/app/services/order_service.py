@@ -1,143 +1,331 @@
-from typing import List, Optional
+from typing import List, Optional, Union
 import uuid
-from sqlmodel import Session, select
+from sqlalchemy import insert, update, tuple_, literal, union_all, exists, func
+from datetime import datetime
+from sqlalchemy.orm import noload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import select, or_, and_
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import HTTPException
 
-from app.models.order import Order, OrderItem, OrderStatus
+from app.core import events
+from app.core.database import upsert
+from app.core.pagination import decode_cursor
+from app.models.order import (
+    Order, OrderItem, OrderStatus, ArchivedOrder, ArchivedOrderItem, ProductPurchase, OrderItemStatusUpdate, OrderItemStatusResult, ITEM_STATUSES, ITEM_DONE_STATUSES,
+)
 from app.models.billing import Invoice
 from app.models.product import Product
 from app.services.cart_service import cart_service
-from app.services.pdf_service import pdf_service
+from app.services.inventory_service import inventory_service
+from app.services.invoice_service import invoice_service
 from app.services.product_service import product_service # Use product service or direct DB access
-from app.services.user_service import user_service # For email
 
 class OrderService:
-    def create_order_from_cart(self, db: Session, user_id: str) -> Order:
+    async def create_order_from_cart(self, db: AsyncSession, user_id: str) -> Order:
+        # Holding the cart lock means no cart change can land between reading the cart and clearing it
+        async with cart_service.locked(user_id):
+            return await self._create_order_from_cart(db, user_id)
+
+    async def _create_order_from_cart(self, db: AsyncSession, user_id: str) -> Order:
         # 1. Get Cart
-        cart = cart_service.get_cart(db, user_id)
+        cart = await cart_service.get_cart(db, user_id)
         if not cart.items:
             raise HTTPException(status_code=400, detail="Cart is empty")
 
-        # 2. Check Stock and Prepare Items
-        order_items = []
-        total_amount = 0.0
-        
-        for cart_item in cart.items:
-            product = db.get(Product, cart_item.product_id)
-            if not product:
-                raise HTTPException(status_code=404, detail=f"Product {cart_item.product_id} not found")
-            
-            if product.stock < cart_item.quantity:
-                raise HTTPException(status_code=400, detail=f"Insufficient stock for {product.name}. Available: {product.stock}")
-            
-            # Decrement Stock
-            product.stock -= cart_item.quantity
-            db.add(product)
-            
-            # Create OrderItem
-            order_item = OrderItem(
-                product_id=product.id,
-                quantity=cart_item.quantity,
-                price_at_purchase=cart_item.price or product.price,
-                product_name=product.name,
-                seller_id=product.seller_id,
-                status="pending"
+        # Everything below is one transaction: stock, order, items, invoice and the
+        # cart clear either all commit together or not at all.
+        repriced = False
+        try:
+            # 2. Load every product in one query
+            # Fixed product order: concurrent checkouts lock the rows in the same sequence
+            cart_items = sorted(cart.items, key=lambda i: i.product_id)
+            statement = select(Product).where(Product.id.in_([i.product_id for i in cart_items]))
+            products = {p.id: p for p in (await db.exec(statement)).all()}
+            # Charge catalog prices, not the ones the client put in the cart
+            repriced = cart_service.revalidate_prices(cart, {p.id: p.price for p in products.values()})
+
+            # 3. Check Stock and Prepare Items
+            order = Order(user_id=user_id, total_amount=0.0, status=OrderStatus.PAID)
+            order_items = []
+            total_amount = 0.0
+            for cart_item in cart_items:
+                product = products.get(cart_item.product_id)
+                if not product:
+                    raise HTTPException(status_code=404, detail=f"Product {cart_item.product_id} not found")
+
+                if cart_item.quantity <= 0:
+                    raise HTTPException(status_code=400, detail=f"Invalid quantity for {product.name}")
+
+                # Conditional decrement, never a read-modify-write of product.stock
+                if not await inventory_service.reserve_stock(db, product.id, cart_item.quantity):
+                    product_id, name = product.id, product.name
+                    await db.rollback()  # expires everything loaded so far
+                    available = await inventory_service.get_stock(db, product_id)
+                    raise HTTPException(status_code=400, detail=f"Insufficient stock for {name}. Available: {available}")
+
+                order_item = OrderItem(
+                    order_id=order.id,
+                    product_id=product.id,
+                    quantity=cart_item.quantity,
+                    price_at_purchase=product.price,
+                    product_name=product.name,
+                    seller_id=product.seller_id,
+                    status="pending"
+                )
+                order_items.append(order_item)
+                total_amount += (order_item.price_at_purchase * order_item.quantity)
+
+            # 4. Create Order, its items (one multi-row INSERT) and the Invoice
+            order.total_amount = total_amount
+            db.add(order)
+            await db.flush()
+            await db.exec(insert(OrderItem), params=[item.model_dump(exclude={"id"}) for item in order_items])
+            await db.exec(upsert(
+                ProductPurchase,
+                [{"user_id": user_id, "product_id": item.product_id, "first_purchased_at": order.created_at} for item in order_items],
+                key=["user_id", "product_id"],
+            ))
+
+            invoice = Invoice(
+                order_id=order.id,
+                user_id=user_id,
+                amount=total_amount
             )
-            order_items.append(order_item)
-            total_amount += (order_item.price_at_purchase * order_item.quantity)
-
-        # 3. Create Order
-        order = Order(
-            user_id=user_id,
-            total_amount=total_amount,
-            status=OrderStatus.PAID
+            db.add(invoice)
+            invoice_service.enqueue(db, invoice)
+
+            # 5. Clear Cart
+            await cart_service.clear_cart(db, user_id)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            if repriced:
+                # No order, but the cart should show what checking out would now cost.
+                # Stored only now: a write-through store commits on its own.
+                await cart_service.save_cart(db, cart)
+            raise
+
+        await cart_service.cart_cleared(db, user_id)
+        # Items went in through Core; attach them without marking the collection dirty
+        set_committed_value(order, "items", order_items)
+        product_service.invalidate(*products)
+        # The PDF is rendered by the invoice workers, not on the checkout path
+        invoice_service.notify()
+
+        event = {"type": "order.created", "order_id": order.id, "status": order.status.value}
+        await events.publish(events.user_channel(user_id), event)
+        for seller_id in {i.seller_id for i in order_items if i.seller_id}:
+            await events.publish(events.seller_channel(seller_id), event)
+        return order
+
+    async def get_order(self, db: AsyncSession, order_id: str) -> Optional[Union[Order, ArchivedOrder]]:
+        order = await db.get(Order, order_id, options=[selectinload(Order.items)])
+        if order is None:
+            # Finished orders move to the archive after a while
+            order = await db.get(ArchivedOrder, order_id, options=[selectinload(ArchivedOrder.items)])
+        return order
+
+    async def list_user_orders(self, db: AsyncSession, user_id: str, page: int = 1, limit: int = 20) -> List[Union[Order, ArchivedOrder]]:
+        # Page over hot and archived orders together. Each side only needs its newest
+        # page*limit rows, which its (user_id, created_at) index serves directly.
+        depth = page * limit
+        hot = (
+            select(Order.id, Order.created_at, literal(False).label("archived"))
+            .where(Order.user_id == user_id).order_by(Order.created_at.desc()).limit(depth)
         )
-        db.add(order)
-        db.commit()
-        db.refresh(order) # Get ID
-        
-        # Link items
-        for item in order_items:
-            item.order_id = order.id
-            db.add(item)
-        db.commit()
-        db.refresh(order)
-        
-        # 4. Create Invoice
-        invoice = Invoice(
-            order_id=order.id,
-            user_id=user_id,
-            amount=total_amount
+        cold = (
+            select(ArchivedOrder.id, ArchivedOrder.created_at, literal(True).label("archived"))
+            .where(ArchivedOrder.user_id == user_id).order_by(ArchivedOrder.created_at.desc()).limit(depth)
         )
-        db.add(invoice)
-        db.commit()
-        db.refresh(invoice)
-        
-        # 5. Generate PDF
-        user = user_service.get_user_by_id(db, user_id)
-        user_email = user.email if user else user_id
-        
-        # Update PDFService to use correct path or string IO later
-        # Assuming PDFService works or we fix it to not use git paths
-        try:
-             pdf_rel_path = pdf_service.generate_invoice_pdf(invoice, order, user_email=user_email)
-             invoice.pdf_url = pdf_rel_path
-             order.pdf_url = pdf_rel_path
-             db.add(invoice)
-             db.add(order)
-             db.commit()
-        except Exception as e:
-            print(f"PDF Gen failed: {e}")
-            pass
-
-        # 6. Clear Cart
-        cart_service.clear_cart(db, user_id)
-        
-        return order
+        merged = union_all(hot.subquery().select(), cold.subquery().select()).subquery()
+        statement = (
+            select(merged.c.id, merged.c.archived)
+            .order_by(merged.c.created_at.desc(), merged.c.id.desc())
+            .offset((page-1)*limit)
+            .limit(limit)
+        )
+        page_rows = (await db.exec(statement)).all()
 
-    def get_order(self, db: Session, order_id: str) -> Optional[Order]:
-        return db.get(Order, order_id)
+        # One extra query per table for the page's orders and items
+        found = {}
+        for model, archived in ((Order, False), (ArchivedOrder, True)):
+            ids = [order_id for order_id, is_archived in page_rows if bool(is_archived) == archived]
+            if ids:
+                statement = select(model).where(model.id.in_(ids)).options(selectinload(model.items))
+                found.update((o.id, o) for o in (await db.exec(statement)).all())
+        return [found[order_id] for order_id, _ in page_rows if order_id in found]
 
-    def list_user_orders(self, db: Session, user_id: str, page: int = 1, limit: int = 20) -> List[Order]:
-        statement = select(Order).where(Order.user_id == user_id).order_by(Order.created_at.desc()).offset((page-1)*limit).limit(limit)
-        return db.exec(statement).all()
+    async def get_merchant_orders(
+        self,
+        db: AsyncSession,
+        seller_id: str,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        status: Optional[str] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+    ) -> List[Order]:
+        """Newest first, keyset paginated. Each order's items are only the seller's own."""
+        seller_items = select(OrderItem.order_id).where(OrderItem.seller_id == seller_id)
+        if status:
+            seller_items = seller_items.where(OrderItem.status == status)
 
-    def get_merchant_orders(self, db: Session, seller_id: str) -> List[Order]:
-        # Complex query: Find orders where any item has seller_id
-        # Easier in SQL: JOIN OrderItem
-        statement = select(Order).join(OrderItem).where(OrderItem.seller_id == seller_id).distinct().order_by(Order.created_at.desc())
-        return db.exec(statement).all()
+        # noload: items are filtered down to the seller's below, in one query for the page
+        statement = select(Order).where(Order.id.in_(seller_items)).options(noload(Order.items))
+        if created_from is not None:
+            statement = statement.where(Order.created_at >= created_from)
+        if created_to is not None:
+            statement = statement.where(Order.created_at < created_to)
+        if cursor:
+            created_at, order_id = decode_cursor(cursor, datetime, str)
+            statement = statement.where(or_(
+                Order.created_at < created_at,
+                and_(Order.created_at == created_at, Order.id < order_id),
+            ))
+        statement = statement.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit)
+        orders = (await db.exec(statement)).all()
+        if not orders:
+            return orders
+
+        items_statement = (
+            select(OrderItem)
+            .where(OrderItem.order_id.in_([o.id for o in orders]), OrderItem.seller_id == seller_id)
+            .order_by(OrderItem.id)
+        )
+        items_by_order = {o.id: [] for o in orders}
+        for item in (await db.exec(items_statement)).all():
+            items_by_order[item.order_id].append(item)
+        for order in orders:
+            set_committed_value(order, "items", items_by_order[order.id])
+        return orders
 
-    def update_order_item_status(self, db: Session, order_id: str, product_id: str, new_status: str, seller_id: str) -> Order:
-        order = self.get_order(db, order_id)
+    async def update_order_item_status(self, db: AsyncSession, order_id: str, product_id: str, new_status: str, seller_id: str) -> Order:
+        # Archived orders are finished and read only: hot table only
+        order = await db.get(Order, order_id, options=[selectinload(Order.items)])
         if not order:
              raise HTTPException(status_code=404, detail="Order not found")
-        
+
         item_found = False
         all_items_completed = True
-        
+
         # Since items are in DB, we need to fetch them or iterate relation
         # We need to update specifically the item for this product/seller
         # Be careful if multiple rows for same product exist (rare in one order but possible if added twice? Cart service merges duplicates)
-        
+
         for item in order.items:
             if item.product_id == product_id and item.seller_id == seller_id:
                 item.status = new_status
                 db.add(item)
                 item_found = True
-            
-            if item.status not in ["delivered", "cancelled", "completed"]:
+
+            if item.status not in ITEM_DONE_STATUSES:
                 all_items_completed = False
-        
+
         if not item_found:
              raise HTTPException(status_code=404, detail="Item not found or not authorized")
 
         if all_items_completed:
             order.status = OrderStatus.COMPLETED
             db.add(order)
-            
-        db.commit()
-        db.refresh(order)
+
+        await db.commit()
+        await self._publish_item_status(order.id, order.user_id, order.status, seller_id, [(product_id, new_status)])
         return order
 
+    async def update_order_item_statuses(
+        self, db: AsyncSession, seller_id: str, updates: List[OrderItemStatusUpdate]
+    ) -> List[OrderItemStatusResult]:
+        """Applies many (order_id, product_id, status) changes with one UPDATE per distinct status.
+
+        Only the seller's own items are touched. Returns one outcome per requested update,
+        in request order; a later update for the same item wins over an earlier one.
+        """
+        latest = {}
+        for index, u in enumerate(updates):
+            if u.status in ITEM_STATUSES:
+                latest[(u.order_id, u.product_id)] = index
+
+        found = set()
+        if latest:
+            statement = select(OrderItem.order_id, OrderItem.product_id).where(
+                OrderItem.seller_id == seller_id,
+                tuple_(OrderItem.order_id, OrderItem.product_id).in_(list(latest)),
+            )
+            found = set((await db.exec(statement)).all())
+
+        by_status = {}
+        for key, index in latest.items():
+            if key in found:
+                by_status.setdefault(updates[index].status, []).append(key)
+        for status, keys in by_status.items():
+            await db.exec(
+                update(OrderItem)
+                .where(OrderItem.seller_id == seller_id, tuple_(OrderItem.order_id, OrderItem.product_id).in_(keys))
+                .values(status=status)
+            )
+
+        # Completion for every touched order at once: no item left that isn't done
+        touched = {order_id for order_id, _ in found}
+        if touched:
+            open_items = select(OrderItem.id).where(
+                OrderItem.order_id == Order.id,
+                OrderItem.status.not_in(ITEM_DONE_STATUSES),
+            )
+            await db.exec(
+                update(Order)
+                .where(Order.id.in_(touched), Order.status != OrderStatus.COMPLETED, ~open_items.exists())
+                .values(status=OrderStatus.COMPLETED, updated_at=datetime.utcnow())
+            )
+        await db.commit()
+
+        if touched:
+            changed = {}
+            for status, keys in by_status.items():
+                for order_id, product_id in keys:
+                    changed.setdefault(order_id, []).append((product_id, status))
+            statement = select(Order.id, Order.user_id, Order.status).where(Order.id.in_(touched))
+            for order_id, user_id, order_status in (await db.exec(statement)).all():
+                await self._publish_item_status(order_id, user_id, order_status, seller_id, changed[order_id])
+
+        results = []
+        for index, u in enumerate(updates):
+            key = (u.order_id, u.product_id)
+            if u.status not in ITEM_STATUSES:
+                error = "Invalid status"
+            elif key not in found:
+                error = "Item not found or not authorized"
+            elif latest[key] != index:
+                error = "Superseded by a later update in this batch"
+            else:
+                error = None
+            results.append(OrderItemStatusResult(**u.model_dump(), updated=error is None, error=error))
+        return results
+
+    async def backfill_purchases(self, db: AsyncSession) -> int:
+        """Fills productpurchase from existing (hot and archived) orders; checkout keeps it current after that."""
+        bought = union_all(
+            select(Order.user_id, OrderItem.product_id, Order.created_at).join(OrderItem, OrderItem.order_id == Order.id),
+            select(ArchivedOrder.user_id, ArchivedOrderItem.product_id, ArchivedOrder.created_at)
+            .join(ArchivedOrderItem, ArchivedOrderItem.order_id == ArchivedOrder.id),
+        ).subquery()
+        missing = (
+            select(bought.c.user_id, bought.c.product_id, func.min(bought.c.created_at))
+            .where(~exists().where(ProductPurchase.user_id == bought.c.user_id, ProductPurchase.product_id == bought.c.product_id))
+            .group_by(bought.c.user_id, bought.c.product_id)
+        )
+        result = await db.exec(insert(ProductPurchase).from_select(["user_id", "product_id", "first_purchased_at"], missing))
+        await db.commit()
+        return result.rowcount
+
+    async def _publish_item_status(self, order_id: str, user_id: str, order_status: OrderStatus, seller_id: str, items: List[tuple]):
+        event = {
+            "type": "order.item_status",
+            "order_id": order_id,
+            "status": order_status.value,
+            "items": [{"product_id": product_id, "status": status} for product_id, status in items],
+        }
+        await events.publish(events.user_channel(user_id), event)
+        await events.publish(events.seller_channel(seller_id), event)
+
 order_service = OrderService()
@@ -1,80 +1,106 @@
 from fpdf import FPDF
 from app.models.billing import Invoice
 from app.models.order import Order
-from app.models.user import UserInDB
 from app.core.config import settings
 import os
 
-class PDFService:
-    def generate_invoice_pdf(self, invoice: Invoice, order: Order, user_email: str) -> str:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-        
-        # Header
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(200, 10, txt="INVOICE", ln=1, align='C')
-        pdf.set_font("Arial", size=12)
-        pdf.cell(200, 10, txt="GitShop Inc.", ln=1, align='C')
-        
-        pdf.ln(10)
-        
-        # Details
-        pdf.cell(0, 10, txt=f"Invoice ID: {invoice.id}", ln=1)
-        pdf.cell(0, 10, txt=f"Order ID: {order.id}", ln=1)
-        pdf.cell(0, 10, txt=f"Date: {invoice.created_at.strftime('%Y-%m-%d %H:%M:%S')}", ln=1)
-        pdf.cell(0, 10, txt=f"Billed To: {user_email}", ln=1)
-        
-        pdf.ln(10)
-        
-        # Table Header
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(100, 10, "Item")
-        pdf.cell(30, 10, "Qty")
-        pdf.cell(30, 10, "Price")
-        pdf.cell(30, 10, "Total")
+def _latin1(text) -> str:
+    # FPDF 1.7 core fonts are latin-1 only
+    return str(text).encode("latin-1", "replace").decode("latin-1")
+
+def render_invoice(data: dict) -> bytes:
+    """Lay out an invoice from plain data (see PDFService.invoice_data) and return the PDF bytes.
+
+    Module level and free of ORM objects so it can also run in a worker process.
+    """
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    # Header
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(200, 10, txt="INVOICE", ln=1, align='C')
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt="GitShop Inc.", ln=1, align='C')
+
+    pdf.ln(10)
+
+    # Details
+    pdf.cell(0, 10, txt=f"Invoice ID: {data['invoice_id']}", ln=1)
+    pdf.cell(0, 10, txt=f"Order ID: {data['order_id']}", ln=1)
+    pdf.cell(0, 10, txt=f"Date: {data['date']}", ln=1)
+    pdf.cell(0, 10, txt=f"Billed To: {_latin1(data['billed_to'])}", ln=1)
+
+    pdf.ln(10)
+
+    # Table Header
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(100, 10, "Item")
+    pdf.cell(30, 10, "Qty")
+    pdf.cell(30, 10, "Price")
+    pdf.cell(30, 10, "Total")
+    pdf.ln(10)
+
+    # Items
+    pdf.set_font("Arial", size=12)
+    for name, qty, price in data["items"]:
+        pdf.cell(100, 10, _latin1(name)[:35])
+        pdf.cell(30, 10, str(qty))
+        pdf.cell(30, 10, f"${price:.2f}")
+        pdf.cell(30, 10, f"${qty * price:.2f}")
         pdf.ln(10)
-        
-        # Items
-        pdf.set_font("Arial", size=12)
+
+    pdf.ln(10)
+
+    # Total
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(160, 10, "Total Amount:", align='R')
+    pdf.cell(30, 10, f"${data['amount']:.2f}", align='L')
+
+    # dest="S" renders to a (latin-1) string instead of a file
+    return pdf.output(dest="S").encode("latin-1")
+
+class PDFService:
+    def invoice_data(self, invoice: Invoice, order: Order, user_email: str) -> dict:
+        items = []
         for item in order.items:
             # Check if item is dict or object (safety)
             if isinstance(item, dict):
-                name = item.get("product_name", "Unknown Product")[:35]
+                name = item.get("product_name", "Unknown Product")
                 qty = item.get("quantity", 0)
                 price = item.get("price_at_purchase", item.get("price", 0.0))
             else:
-                name = getattr(item, "product_name", "Unknown Product")[:35]
+                name = getattr(item, "product_name", "Unknown Product")
                 qty = getattr(item, "quantity", 0)
                 price = getattr(item, "price_at_purchase", getattr(item, "price", 0.0))
-            
-            total = qty * price
-            
-            pdf.cell(100, 10, name)
-            pdf.cell(30, 10, str(qty))
-            pdf.cell(30, 10, f"${price:.2f}")
-            pdf.cell(30, 10, f"${total:.2f}")
-            pdf.ln(10)
-            
-        pdf.ln(10)
-        
-        # Total
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(160, 10, "Total Amount:", align='R')
-        pdf.cell(30, 10, f"${invoice.amount:.2f}", align='L')
-        
-        # Save
-        # Save
+            items.append((name, qty, price))
+        return {
+            "invoice_id": invoice.id,
+            "order_id": order.id,
+            "date": invoice.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            "billed_to": user_email,
+            "items": items,
+            "amount": invoice.amount,
+        }
+
+    def render_invoice_pdf(self, invoice: Invoice, order: Order, user_email: str) -> bytes:
+        return render_invoice(self.invoice_data(invoice, order, user_email))
+
+    def pdf_path(self, invoice_id: str) -> str:
+        return os.path.join(settings.UPLOAD_DIR, "invoices", "pdfs", f"{invoice_id}.pdf")
+
+    def save_invoice_pdf(self, invoice_id: str, content: bytes) -> str:
         # Make sure directory exists: uploads/invoices/pdfs
-        output_dir = os.path.join(settings.UPLOAD_DIR, "invoices", "pdfs")
-        os.makedirs(output_dir, exist_ok=True)
-        
-        filename = f"{invoice.id}.pdf"
-        output_path = os.path.join(output_dir, filename)
-        
-        pdf.output(output_path)
-        
+        output_path = self.pdf_path(invoice_id)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "wb") as f:
+            f.write(content)
         # Return relative path for storage
-        return f"invoices/pdfs/{filename}"
+        return f"invoices/pdfs/{invoice_id}.pdf"
+
+    def load_invoice_pdf(self, invoice_id: str) -> bytes:
+        # Raises FileNotFoundError when the stored copy is gone
+        with open(self.pdf_path(invoice_id), "rb") as f:
+            return f.read()
 
 pdf_service = PDFService()
@@ -0,0 +1,135 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.product import Product, ProductCreate
+from app.services.product_service import product_service
+
+EXPORT_FIELDS = ["id", "name", "description", "price", "currency", "stock", "category", "images", "videos", "created_at", "updated_at"]
+LIST_FIELDS = ("images", "videos")
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into decoded lines without holding more than one partial line."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8", errors="replace")
+    if buffer:
+        yield buffer.rstrip(b"\r").decode("utf-8", errors="replace")
+
+async def iter_csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[Dict[str, str]]:
+    header = None
+    pending = ""
+    async for line in lines:
+        pending = f"{pending}\n{line}" if pending else line
+        # A quoted field may span lines; wait until the quotes balance
+        if pending.count('"') % 2:
+            continue
+        values = next(csv.reader([pending]), [])
+        pending = ""
+        if header is None:
+            header = [h.strip() for h in values]
+        elif values:
+            yield dict(zip(header, values))
+
+async def iter_ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    async for line in lines:
+        if line.strip():
+            yield line
+
+def parse_row(raw: Any, fmt: str) -> dict:
+    # Parsing happens outside the generators so a bad row doesn't end the stream
+    if fmt != "csv":
+        record = json.loads(raw)
+        if not isinstance(record, dict):
+            raise ValueError("expected a JSON object")
+        return record
+    record = dict(raw)
+    for field in LIST_FIELDS:
+        value = (record.get(field) or "").strip()
+        record[field] = json.loads(value) if value.startswith("[") else [v for v in value.split("|") if v]
+    return record
+
+class ProductBulkService:
+    async def import_products(self, db: AsyncSession, chunks: AsyncIterator[bytes], fmt: str, seller_id: str) -> dict:
+        """Validate each record against ProductCreate and insert valid ones in multi-row batches.
+
+        Every batch is committed on its own, so a bad row never discards the rows around it.
+        """
+        lines = iter_lines(chunks)
+        rows = iter_csv_rows(lines) if fmt == "csv" else iter_ndjson_rows(lines)
+        batch: List[dict] = []
+        inserted = 0
+        failed = 0
+        errors = []
+        row = 0
+
+        async for raw in rows:
+            row += 1
+            try:
+                product_in = ProductCreate.model_validate({**parse_row(raw, fmt), "seller_id": seller_id})
+            except (ValueError, ValidationError) as e:
+                failed += 1
+                if len(errors) < settings.PRODUCT_IMPORT_MAX_ERRORS:
+                    if isinstance(e, ValidationError):
+                        message = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                    else:
+                        message = str(e)
+                    errors.append({"row": row, "error": message})
+                continue
+
+            now = datetime.utcnow()
+            batch.append({**product_in.model_dump(), "id": str(uuid.uuid4()), "created_at": now, "updated_at": now})
+            if len(batch) >= settings.PRODUCT_IMPORT_BATCH_SIZE:
+                inserted += await self._insert_batch(db, batch)
+                batch = []
+
+        if batch:
+            inserted += await self._insert_batch(db, batch)
+        if inserted:
+            product_service.invalidate()
+        return {"inserted": inserted, "failed": failed, "errors": errors}
+
+    async def _insert_batch(self, db: AsyncSession, batch: List[dict]) -> int:
+        # executemany on a single INSERT: the driver sends multi-row VALUES
+        await db.exec(insert(Product), params=batch)
+        await db.commit()
+        return len(batch)
+
+    async def export_products(self, seller_id: str, fmt: str) -> AsyncIterator[str]:
+        # Own session: the response body outlives the request's dependencies
+        async with async_session() as db:
+            statement = (
+                select(Product)
+                .where(Product.seller_id == seller_id)
+                .order_by(Product.created_at, Product.id)
+                .execution_options(yield_per=settings.PRODUCT_IMPORT_BATCH_SIZE)
+            )
+            result = await db.stream(statement)
+            if fmt == "csv":
+                yield self._csv_line(EXPORT_FIELDS)
+            async for product in result.scalars():
+                data = product.model_dump(include=set(EXPORT_FIELDS), mode="json")
+                if fmt == "csv":
+                    yield self._csv_line([json.dumps(data[f]) if f in LIST_FIELDS else data[f] for f in EXPORT_FIELDS])
+                else:
+                    yield json.dumps(data) + "\n"
+                # Detach so the identity map doesn't grow with the export
+                db.expunge(product)
+
+    def _csv_line(self, values: list) -> str:
+        out = io.StringIO()
+        csv.writer(out).writerow(values)
+        return out.getvalue()
+
+product_bulk_service = ProductBulkService()
@@ -1,47 +1,119 @@
 from typing import List, Optional
-from sqlmodel import Session, select
+from datetime import datetime
+from sqlmodel import select, or_, and_
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.models.product import Product, ProductCreate
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.pagination import decode_cursor
+from app.services.search_service import search_service
+
+# Read-through caches for the catalog. Entries are detached from any session and
+# must be treated as read-only; writes go through db.get() and invalidate().
+product_cache = TTLCache("products", maxsize=settings.PRODUCT_CACHE_MAX_SIZE, ttl=settings.PRODUCT_CACHE_TTL_SECONDS)
+product_list_cache = TTLCache("product_lists", maxsize=settings.PRODUCT_LIST_CACHE_MAX_SIZE, ttl=settings.PRODUCT_CACHE_TTL_SECONDS)
 
 class ProductService:
-    def create_product(self, db: Session, product_in: ProductCreate) -> Product:
+    def invalidate(self, *product_ids: str):
+        for product_id in product_ids:
+            product_cache.invalidate(product_id)
+        # Any write can move a product in or out of any listing
+        product_list_cache.clear()
+
+    async def create_product(self, db: AsyncSession, product_in: ProductCreate) -> Product:
         product = Product(**product_in.dict())
         db.add(product)
-        db.commit()
-        db.refresh(product)
+        await db.commit()
+        await db.refresh(product)
+        self.invalidate()
+        return product
+
+    async def get_product(self, db: AsyncSession, product_id: str) -> Optional[Product]:
+        product = product_cache.get(product_id)
+        if product is None:
+            product = await db.get(Product, product_id)
+            if product:
+                db.expunge(product)
+                product_cache.set(product_id, product)
         return product
 
-    def get_product(self, db: Session, product_id: str) -> Optional[Product]:
-        return db.get(Product, product_id)
+    async def list_products(
+        self,
+        db: AsyncSession,
+        page: int = 1,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        q: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        seller_id: Optional[str] = None,
+        in_stock: Optional[bool] = None,
+    ) -> List[Product]:
+        cache_key = (page, limit, cursor, q, category, min_price, max_price, seller_id, in_stock)
+        products = product_list_cache.get(cache_key)
+        if products is not None:
+            return products
 
-    def list_products(self, db: Session, page: int = 1, limit: int = 20) -> List[Product]:
-        statement = select(Product).order_by(Product.created_at.desc()).offset((page - 1) * limit).limit(limit)
-        return db.exec(statement).all()
+        statement = select(Product)
+        if category:
+            statement = statement.where(Product.category == category)
+        if min_price is not None:
+            statement = statement.where(Product.price >= min_price)
+        if max_price is not None:
+            statement = statement.where(Product.price <= max_price)
+        if seller_id:
+            statement = statement.where(Product.seller_id == seller_id)
+        if in_stock is not None:
+            statement = statement.where(Product.stock > 0 if in_stock else Product.stock <= 0)
+        if q and q.strip():
+            # Relevance first; newest breaks ties
+            statement = search_service.apply(statement, db.bind.dialect.name, q)
 
-    def update_product(self, db: Session, product_id: str, product_in: ProductCreate, seller_id: str) -> Optional[Product]:
-        product = self.get_product(db, product_id)
+        statement = statement.order_by(Product.created_at.desc(), Product.id.desc()).limit(limit)
+        if cursor:
+            # Keyset: seek past the last row of the previous page instead of OFFSET
+            created_at, product_id = decode_cursor(cursor, datetime, str)
+            statement = statement.where(or_(
+                Product.created_at < created_at,
+                and_(Product.created_at == created_at, Product.id < product_id),
+            ))
+        else:
+            statement = statement.offset((page - 1) * limit)
+        products = (await db.exec(statement)).all()
+        for product in products:
+            db.expunge(product)
+        product_list_cache.set(cache_key, products)
+        return products
+
+    async def update_product(self, db: AsyncSession, product_id: str, product_in: ProductCreate, seller_id: str) -> Optional[Product]:
+        product = await db.get(Product, product_id)
         if not product:
             return None
         # Verify ownership? The service signature asks for seller_id, but logically we should check if product.seller_id == seller_id
         if product.seller_id != seller_id:
              return None # Or raise Auth error
-        
+
         product_data = product_in.dict(exclude_unset=True)
         # Prevent changing core fields if necessary, usually safe
         for key, value in product_data.items():
             setattr(product, key, value)
-            
+        product.updated_at = datetime.utcnow()
+
         db.add(product)
-        db.commit()
-        db.refresh(product)
+        await db.commit()
+        await db.refresh(product)
+        self.invalidate(product_id)
         return product
 
-    def delete_product(self, db: Session, product_id: str, seller_id: str) -> bool:
-        product = self.get_product(db, product_id)
+    async def delete_product(self, db: AsyncSession, product_id: str, seller_id: str) -> bool:
+        product = await db.get(Product, product_id)
         if not product or product.seller_id != seller_id:
             return False
-            
-        db.delete(product)
-        db.commit()
+
+        await db.delete(product)
+        await db.commit()
+        self.invalidate(product_id)
         return True
 
 product_service = ProductService()
@@ -1,53 +1,152 @@
-from typing import List, Optional
-from sqlmodel import Session, select
-from app.models.review import Review, ReviewCreate
-from app.models.order import Order, OrderItem
+import logging
 from datetime import datetime
+from typing import List, Optional
+from fastapi import HTTPException
+from sqlalchemy import delete, event, exists, func, update, select as sa_select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.database import upsert
+from app.core.pagination import encode_cursor, decode_cursor, after_cursor
+from app.models.review import Review, ReviewCreate, ReviewSort
+from app.models.order import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, ProductPurchase
+from app.models.product import Product
+from app.services.product_service import product_service, product_cache, product_list_cache
+
+logger = logging.getLogger(__name__)
+
+# Sort key of each ReviewSort (columns, their cursor types, descending); the trailing id breaks ties
+REVIEW_SORTS = {
+    ReviewSort.NEWEST: ([Review.created_at, Review.id], [datetime, str], True),
+    ReviewSort.HIGHEST: ([Review.rating, Review.created_at, Review.id], [int, datetime, str], True),
+    ReviewSort.LOWEST: ([Review.rating, Review.created_at, Review.id], [int, datetime, str], False),
+}
 
 class ReviewService:
-    def create_review(self, db: Session, review_in: ReviewCreate, user_id: str, user_name: str) -> Optional[Review]:
+    async def create_review(self, db: AsyncSession, review_in: ReviewCreate, user_id: str, user_name: str) -> Optional[Review]:
         # 1. Verify Purchase
-        # Check if user has an order with this product
-        statement = select(OrderItem).join(Order).where(
-            Order.user_id == user_id,
-            OrderItem.product_id == review_in.product_id
-        )
-        has_purchased = db.exec(statement).first()
-        
-        if not has_purchased:
+        if not await self._has_purchased(db, user_id, review_in.product_id):
             return None # Or raise exception in caller
-            
-        # 2. Check for existing review (Upsert)
-        statement = select(Review).where(
+
+        if not 1 <= review_in.rating <= 5:
+            raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
+
+        # 2. Upsert on the unique (product_id, user_id) index. The previous rating is
+        # read first (and locked) because the rating aggregates need it.
+        statement = select(Review.id, Review.rating, Review.created_at).where(
             Review.product_id == review_in.product_id,
             Review.user_id == user_id
-        )
-        existing_review = db.exec(statement).first()
-        
-        if existing_review:
-            # Update
-            existing_review.rating = review_in.rating
-            existing_review.comment = review_in.comment
-            existing_review.images = review_in.images
-            # existing_review.created_at = datetime.utcnow() # Optional: update timestamp?
-            db.add(existing_review)
-            db.commit()
-            db.refresh(existing_review)
-            return existing_review
-        else:
-            # Create
-            review = Review(
-                **review_in.dict(), 
-                user_id=user_id,
-                user_name=user_name
+        ).with_for_update()
+        previous = (await db.exec(statement)).first()
+
+        review = Review(**review_in.model_dump(), user_id=user_id, user_name=user_name)
+        if previous:
+            review.id, review.created_at = previous.id, previous.created_at
+        await db.exec(upsert(Review, [review.model_dump()], key=["product_id", "user_id"], update=["rating", "comment", "images"]))
+        await self._adjust_aggregates(db, review_in.product_id, old_rating=previous.rating if previous else None, new_rating=review_in.rating)
+        await db.commit()
+        product_service.invalidate(review_in.product_id)
+        return review
+
+    async def _has_purchased(self, db: AsyncSession, user_id: str, product_id: str) -> bool:
+        # Checkout records every (customer, product) in productpurchase
+        if await db.get(ProductPurchase, (user_id, product_id)):
+            return True
+        # Orders placed before that (until manage.py backfill-purchases has run), possibly
+        # archived since; a hit is recorded so the next check is the lookup above
+        for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+            statement = (
+                select(order_model.created_at)
+                .join(item_model, item_model.order_id == order_model.id)
+                .where(order_model.user_id == user_id, item_model.product_id == product_id)
+                .order_by(order_model.created_at)
+                .limit(1)
             )
-            db.add(review)
-            db.commit()
-            db.refresh(review)
-            return review
-
-    def list_reviews(self, db: Session, product_id: str) -> List[Review]:
-        statement = select(Review).where(Review.product_id == product_id).order_by(Review.created_at.desc())
-        return db.exec(statement).all()
+            first_purchased_at = (await db.exec(statement)).first()
+            if first_purchased_at is not None:
+                purchase = {"user_id": user_id, "product_id": product_id, "first_purchased_at": first_purchased_at}
+                await db.exec(upsert(ProductPurchase, [purchase], key=["user_id", "product_id"]))
+                return True
+        return False
+
+    async def list_reviews(
+        self,
+        db: AsyncSession,
+        product_id: str,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        sort: ReviewSort = ReviewSort.NEWEST,
+    ) -> List[Review]:
+        """Keyset paginated; continue from a page with review_cursor() of its last review."""
+        columns, types, descending = REVIEW_SORTS[sort]
+        statement = select(Review).where(Review.product_id == product_id)
+        if cursor:
+            values = decode_cursor(cursor, *types)
+            statement = statement.where(after_cursor(columns, values, descending))
+        order = [c.desc() if descending else c.asc() for c in columns]
+        statement = statement.order_by(*order).limit(limit)
+        return (await db.exec(statement)).all()
+
+    def review_cursor(self, review: Review, sort: ReviewSort) -> str:
+        columns, _, _ = REVIEW_SORTS[sort]
+        return encode_cursor(*[getattr(review, c.key) for c in columns])
+
+    async def _adjust_aggregates(self, db: AsyncSession, product_id: str, old_rating: Optional[int], new_rating: int):
+        # Relative UPDATE in the review's transaction, so concurrent reviews can't lose counts
+        values = {}
+        if old_rating is None:
+            values[Product.rating_count] = Product.rating_count + 1
+        elif old_rating != new_rating:
+            old_bucket = getattr(Product, f"rating_{old_rating}")
+            values[old_bucket] = old_bucket - 1
+        else:
+            return
+        new_bucket = getattr(Product, f"rating_{new_rating}")
+        values[new_bucket] = new_bucket + 1
+        values[Product.rating_sum] = Product.rating_sum + (new_rating - (old_rating or 0))
+        # Ratings are part of the product response, so its ETag/Last-Modified must move
+        values[Product.updated_at] = datetime.utcnow()
+        await db.exec(update(Product).where(Product.id == product_id).values(values))
+
+    async def rebuild_rating_aggregates(self, db: AsyncSession) -> int:
+        """Recomputes every product's aggregates from the review table in one UPDATE."""
+        result = await db.exec(_recompute_aggregates())
+        await db.commit()
+        product_cache.clear()
+        product_list_cache.clear()
+        return result.rowcount
+
+def _recompute_aggregates():
+    def reviews(*criteria):
+        return select(func.count(Review.id)).where(Review.product_id == Product.id, *criteria).scalar_subquery()
+
+    values = {
+        Product.rating_count: reviews(),
+        Product.rating_sum: select(func.coalesce(func.sum(Review.rating), 0)).where(Review.product_id == Product.id).scalar_subquery(),
+    }
+    for stars in range(1, 6):
+        values[getattr(Product, f"rating_{stars}")] = reviews(Review.rating == stars)
+    values[Product.updated_at] = datetime.utcnow()
+    return update(Product).values(values)
+
+@event.listens_for(next(i for i in Review.__table__.indexes if i.name == "ix_review_product_id_user_id"), "before_create")
+def _drop_duplicate_reviews(index, connection, **kw):
+    # Before the unique index, a double submit could store two reviews for the same
+    # customer and product, and the index can't be created over them. Keep the newest.
+    review, newer = Review.__table__, Review.__table__.alias("newer")
+    statement = sa_select(review.c.id, review.c.product_id).where(exists().where(
+        newer.c.product_id == review.c.product_id,
+        newer.c.user_id == review.c.user_id,
+        after_cursor([newer.c.created_at, newer.c.id], [review.c.created_at, review.c.id], descending=False),
+    ))
+    stale = connection.execute(statement).all()
+    if not stale:
+        return
+    # Selected first: MySQL can't DELETE from a table its subquery reads
+    ids = [review_id for review_id, _ in stale]
+    for start in range(0, len(ids), 1000):
+        connection.execute(delete(review).where(review.c.id.in_(ids[start:start + 1000])))
+    product_ids = list({product_id for _, product_id in stale})
+    connection.execute(_recompute_aggregates().where(Product.id.in_(product_ids)))
+    logger.warning("Removed %s duplicate reviews before creating %s", len(ids), index.name)
 
 review_service = ReviewService()
@@ -0,0 +1,78 @@
+import logging
+from sqlalchemy import text, table, column, or_
+from sqlalchemy.dialects.mysql import match
+from app.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+# Full-text search over Product.name/description.
+# MySQL: a FULLTEXT index queried with MATCH ... AGAINST (natural language mode).
+# SQLite (local runs/tests): an FTS5 table kept in sync with triggers.
+# Anything else falls back to LIKE, which is correct but unindexed.
+
+FULLTEXT_INDEX = "ft_product_name_description"
+
+product_fts = table("product_fts", column("product_id"), column("rank"))
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(product_id UNINDEXED, name, description)",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(product_id, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        DELETE FROM product_fts WHERE product_id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description ON product BEGIN
+        DELETE FROM product_fts WHERE product_id = old.id;
+        INSERT INTO product_fts(product_id, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+class SearchService:
+    async def install(self, engine):
+        """Create the full-text index for the engine's dialect (idempotent)."""
+        async with engine.begin() as conn:
+            await conn.run_sync(self._install)
+
+    def _install(self, conn):
+        dialect = conn.dialect.name
+        if dialect == "mysql":
+            exists = conn.execute(text(
+                "SELECT 1 FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = 'product' AND index_name = :name LIMIT 1"
+            ), {"name": FULLTEXT_INDEX}).first()
+            if not exists:
+                logger.info("Creating FULLTEXT index %s", FULLTEXT_INDEX)
+                conn.execute(text(f"CREATE FULLTEXT INDEX {FULLTEXT_INDEX} ON product (name, description)"))
+        elif dialect == "sqlite":
+            created = not conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'product_fts'"
+            )).first()
+            for ddl in SQLITE_FTS_DDL:
+                conn.execute(text(ddl))
+            if created:
+                # Index rows that predate the FTS table
+                conn.execute(text(
+                    "INSERT INTO product_fts(product_id, name, description) SELECT id, name, description FROM product"
+                ))
+
+    def apply(self, statement, dialect: str, q: str):
+        """Restrict a select(Product) to rows matching q, ordered by relevance."""
+        terms = q.split()
+        if dialect == "mysql":
+            score = match(Product.name, Product.description, against=q).in_natural_language_mode()
+            return statement.where(score > 0).order_by(score.desc())
+        if dialect == "sqlite":
+            # Quote every term so user input can't inject FTS5 query syntax
+            fts_query = " OR ".join('"%s"' % t.replace('"', '""') for t in terms)
+            return (
+                statement.join(product_fts, product_fts.c.product_id == Product.id)
+                .where(text("product_fts MATCH :fts_query").bindparams(fts_query=fts_query))
+                .order_by(product_fts.c.rank)
+            )
+        return statement.where(or_(*(
+            or_(Product.name.contains(t, autoescape=True), Product.description.contains(t, autoescape=True))
+            for t in terms
+        )))
+
+search_service = SearchService()
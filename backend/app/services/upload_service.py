@@ -0,0 +1,94 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import uuid
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+class UploadService:
+    """Stores uploads by content: <UPLOAD_DIR>/ab/cd/<sha256><ext>.
+
+    The upload is copied to a temporary file in chunks (disk I/O off the event loop)
+    and hashed on the way, then renamed into place. The same bytes uploaded twice
+    are stored once, and the two shard levels keep every directory small.
+    """
+
+    def __init__(self):
+        # StaticFiles picks Content-Type from the extension; make it agree with UPLOAD_TYPES
+        for extension, content_type in settings.UPLOAD_TYPES.items():
+            mimetypes.add_type(content_type, extension)
+
+    def extension(self, file: UploadFile) -> str:
+        # From the file name, else the declared type; either way one of UPLOAD_TYPES.
+        # The size limit follows from it, so a file is capped as what it is served as.
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        if extension in settings.UPLOAD_TYPES:
+            return extension
+        content_type = (file.content_type or "").split(";")[0].strip().lower()
+        for extension, allowed_type in settings.UPLOAD_TYPES.items():
+            if allowed_type == content_type:
+                return extension
+        raise HTTPException(status_code=415, detail=f"Unsupported file type, allowed: {', '.join(settings.UPLOAD_TYPES)}")
+
+    def max_bytes(self, extension: str) -> int:
+        major = settings.UPLOAD_TYPES[extension].split("/", 1)[0]
+        if major == "image":
+            return settings.UPLOAD_MAX_IMAGE_BYTES
+        if major == "video":
+            return settings.UPLOAD_MAX_VIDEO_BYTES
+        return settings.UPLOAD_MAX_OTHER_BYTES
+
+    def tmp_dir(self) -> str:
+        return settings.UPLOAD_TMP_DIR or settings.UPLOAD_DIR.rstrip("/\\") + ".tmp"
+
+    async def save(self, file: UploadFile) -> str:
+        """Returns the stored file's path relative to UPLOAD_DIR."""
+        extension = self.extension(file)
+        limit = self.max_bytes(extension)
+        too_large = HTTPException(status_code=413, detail=f"File too large, the limit for {settings.UPLOAD_TYPES[extension]} is {limit} bytes")
+        if file.size is not None and file.size > limit:
+            raise too_large
+
+        tmp_dir = self.tmp_dir()
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        await run_in_threadpool(os.makedirs, tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        out = await run_in_threadpool(open, tmp_path, "wb")
+        try:
+            while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise too_large
+                await run_in_threadpool(self._write, out, digest, chunk)
+            await run_in_threadpool(out.close)
+
+            name = digest.hexdigest()
+            relative_path = f"{name[:2]}/{name[2:4]}/{name}{extension}"
+            await run_in_threadpool(self._store, tmp_path, os.path.join(settings.UPLOAD_DIR, relative_path))
+            return relative_path
+        finally:
+            out.close()
+            await run_in_threadpool(self._discard, tmp_path)
+
+    def _write(self, out, digest, chunk: bytes):
+        digest.update(chunk)
+        out.write(chunk)
+
+    def _store(self, tmp_path: str, path: str):
+        if os.path.exists(path):
+            return  # Same content already stored
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A rename when UPLOAD_TMP_DIR is on the same filesystem, a copy otherwise
+        shutil.move(tmp_path, path)
+
+    def _discard(self, tmp_path: str):
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+upload_service = UploadService()
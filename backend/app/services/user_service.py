@@ -1,20 +1,39 @@
 from typing import Optional, List
-from sqlmodel import Session, select
-from app.models.user import User, UserCreate, UserUpdate
-from app.core.security import get_password_hash
+from sqlmodel import select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models.user import User, UserCreate, UserUpdate, UserRole
+from app.models.product import Product
+from app.services.product_service import product_service
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.security import get_password_hash_async
+
+# Keyed by email (the JWT subject). Entries are detached from any session.
+user_cache = TTLCache("users", maxsize=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
 
 class UserService:
-    def get_user_by_email(self, db: Session, email: str) -> Optional[User]:
+    async def get_user_by_email(self, db: AsyncSession, email: str) -> Optional[User]:
         statement = select(User).where(User.email == email)
-        return db.exec(statement).first()
+        return (await db.exec(statement)).first()
+
+    async def get_cached_user_by_email(self, db: AsyncSession, email: str) -> Optional[User]:
+        user = user_cache.get(email)
+        if user is None:
+            user = await self.get_user_by_email(db, email)
+            if user:
+                # Detach so the cached instance isn't tied to this request's session
+                db.expunge(user)
+                user_cache.set(email, user)
+        return user
 
-    def get_user_by_id(self, db: Session, user_id: str) -> Optional[User]:
-        return db.get(User, user_id)
+    async def get_user_by_id(self, db: AsyncSession, user_id: str) -> Optional[User]:
+        return await db.get(User, user_id)
 
-    def create_user(self, db: Session, user_in: UserCreate) -> User:
+    async def create_user(self, db: AsyncSession, user_in: UserCreate) -> User:
+        hashed_password = await get_password_hash_async(user_in.password)
         db_obj = User(
             email=user_in.email,
-            hashed_password=get_password_hash(user_in.password),
+            hashed_password=hashed_password,
             full_name=user_in.full_name,
             role=user_in.role,
             phone_number=user_in.phone_number,
@@ -26,15 +45,15 @@ class UserService:
             ifsc_code=user_in.ifsc_code
         )
         db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
         return db_obj
 
-    def update_user(self, db: Session, user_id: str, user_in: UserUpdate) -> Optional[User]:
-        user = self.get_user_by_id(db, user_id)
+    async def update_user(self, db: AsyncSession, user_id: str, user_in: UserUpdate) -> Optional[User]:
+        user = await self.get_user_by_id(db, user_id)
         if not user:
             return None
-        
+
         user_data = user_in.dict(exclude_unset=True)
         # Handle address_details conversion if needed, but SQLModel might handle Dict
         if "address_details" in user_data and user_data["address_details"]:
@@ -42,10 +61,23 @@ class UserService:
 
         for key, value in user_data.items():
             setattr(user, key, value)
-            
+
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        user_cache.invalidate(user.email)
         return user
 
+    async def delete_user(self, db: AsyncSession, user: User):
+        product_ids = []
+        # If seller, delete all products
+        if user.role == UserRole.SELLER:
+            product_ids = (await db.exec(select(Product.id).where(Product.seller_id == user.id))).all()
+            await db.exec(delete(Product).where(Product.seller_id == user.id))
+        await db.exec(delete(User).where(User.id == user.id))
+        await db.commit()
+        user_cache.invalidate(user.email)
+        if product_ids:
+            product_service.invalidate(*product_ids)
+
 user_service = UserService()
@@ -1,8 +1,17 @@
 import os
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import init_db, engine, warm_pool, get_pool_stats, count_queries
+from app.core import events
+from app.core.cache import get_cache_stats
+from app.core.security import get_hasher_stats
+from app.services.search_service import search_service
+from app.services.invoice_service import invoice_service
+from app.services.invoice_export_service import invoice_export_service
+from app.services.idempotency_service import idempotency_service
+from app.services.archive_service import archive_service
+from app.services.cart_service import cart_service
 
 from app.api.products import router as product_router
 from app.api.inventory import router as inventory_router
@@ -27,8 +36,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed"],
 )
 
+@app.middleware("http")
+async def query_count_guard(request: Request, call_next):
+    if not settings.QUERY_COUNT_LIMIT:
+        return await call_next(request)
+    with count_queries() as counter:
+        response = await call_next(request)
+    response.headers["X-Query-Count"] = str(counter[0])
+    return response
+
 # Include Routers
 app.include_router(auth_router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 app.include_router(product_router, prefix=f"{settings.API_V1_STR}/products", tags=["products"])
@@ -45,7 +64,23 @@ app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads"
 @app.on_event("startup")
 async def startup_event():
     logging.info("Initializing Database...")
-    init_db()
+    await init_db()
+    await search_service.install(engine)
+    await warm_pool(settings.DB_POOL_WARM_CONNECTIONS)
+    invoice_service.start()
+    idempotency_service.start()
+    archive_service.start()
+    cart_service.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await invoice_service.stop()
+    await idempotency_service.stop()
+    await archive_service.stop()
+    await cart_service.stop()
+    invoice_export_service.shutdown()
+    await events.broker.close()
+    await engine.dispose()
 
 @app.get("/")
 def root():
@@ -54,3 +89,15 @@ def root():
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+@app.get("/health/db")
+def health_db():
+    return get_pool_stats()
+
+@app.get("/health/cache")
+def health_cache():
+    return get_cache_stats()
+
+@app.get("/health/hasher")
+def health_hasher():
+    return get_hasher_stats()
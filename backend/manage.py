@@ -0,0 +1,56 @@
+"""Maintenance commands, run from backend/ against the configured DATABASE_URL:
+
+    python manage.py archive-orders [--older-than-days N] [--batch-size N]
+    python manage.py rebuild-ratings
+    python manage.py backfill-purchases
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.core.database import init_db, async_session, engine
+import app.models.billing, app.models.cart, app.models.product, app.models.review, app.models.user  # noqa: F401 register tables for init_db
+from app.services.archive_service import archive_service
+from app.services.order_service import order_service
+from app.services.review_service import review_service
+
+async def archive_orders(args):
+    older_than = datetime.utcnow() - timedelta(days=args.older_than_days)
+    async with async_session() as db:
+        archived = await archive_service.archive_orders(db, older_than, args.batch_size)
+    print(f"archived {archived} orders created before {older_than:%Y-%m-%d %H:%M}")
+
+async def rebuild_ratings(args):
+    async with async_session() as db:
+        updated = await review_service.rebuild_rating_aggregates(db)
+    print(f"rebuilt rating aggregates for {updated} products")
+
+async def backfill_purchases(args):
+    async with async_session() as db:
+        added = await order_service.backfill_purchases(db)
+    print(f"recorded {added} customer/product purchases")
+
+async def main(args):
+    await init_db()
+    try:
+        await args.command(args)
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(required=True)
+
+    archive = commands.add_parser("archive-orders", help="move finished orders to the archive tables")
+    archive.add_argument("--older-than-days", type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS)
+    archive.add_argument("--batch-size", type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE)
+    archive.set_defaults(command=archive_orders)
+
+    ratings = commands.add_parser("rebuild-ratings", help="recompute product rating aggregates from the reviews")
+    ratings.set_defaults(command=rebuild_ratings)
+
+    purchases = commands.add_parser("backfill-purchases", help="record purchases from existing orders for review checks")
+    purchases.set_defaults(command=backfill_purchases)
+
+    asyncio.run(main(parser.parse_args()))
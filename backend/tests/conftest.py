@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway SQLite database before anything imports settings
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["UPLOAD_DIR"] = os.path.join(_tmp, "uploads")
+os.environ["CART_STORE_URL"] = "memory://"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+API = "/api/v1"
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+@pytest.fixture(scope="session")
+def customer(client):
+    client.post(f"{API}/auth/signup", json={"email": "customer@example.com", "full_name": "Customer", "password": "pw"})
+    token = client.post(f"{API}/auth/login/access-token", data={"username": "customer@example.com", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    return {"headers": headers, "id": client.get(f"{API}/auth/me", headers=headers).json()["id"]}
@@ -0,0 +1,62 @@
+import json
+
+from app.core.database import async_session
+from app.models.cart import CartItemBase, CartRead
+from app.services import cart_service as cart_service_module
+from app.services.cart_service import cart_service
+from app.services.cart_store import MemoryCartStore, cart_store, load_cart
+from tests.conftest import API
+
+def _cart(user_id: str, price: float = 2.0) -> CartRead:
+    return CartRead(id=f"cart-{user_id}", user_id=user_id, total=price, items=[CartItemBase(product_id="p1", quantity=1, price=price)])
+
+def test_non_finite_or_negative_items_are_rejected(client, customer):
+    for body in ('{"product_id": "p1", "quantity": 1, "price": Infinity}',
+                 '{"product_id": "p1", "quantity": 1, "price": NaN}',
+                 '{"product_id": "p1", "quantity": 1, "price": -5}',
+                 '{"product_id": "p1", "quantity": 0, "price": 1}'):
+        r = client.post(f"{API}/store/cart/add", content=body, headers={**customer["headers"], "Content-Type": "application/json"})
+        assert r.status_code == 400, (body, r.text)
+
+    r = client.post(f"{API}/store/cart/add", json={"product_id": "p1", "quantity": 2, "price": 1.5}, headers=customer["headers"])
+    assert r.status_code == 200
+    assert r.json()["total"] == 3.0
+    assert client.get(f"{API}/store/cart", headers=customer["headers"]).status_code == 200
+
+def test_undecodable_cart_does_not_block_the_batch(client):
+    async def run():
+        store = MemoryCartStore(maxsize=10)
+        await store.put(None, _cart("good-1"))
+        await store.put(None, _cart("good-2"))
+        store._carts["poisoned"] = json.dumps({"id": "c", "user_id": "poisoned", "total": None, "items": []})
+        store._dirty.add("poisoned")
+
+        carts = await store.take_dirty(10)
+        assert sorted(c.user_id for c in carts) == ["good-1", "good-2"]
+        assert await store.get("poisoned") is None
+        assert await store.take_dirty(10) == []
+
+    client.portal.call(run)
+
+def test_flush_isolates_a_cart_that_fails_to_write(client, monkeypatch):
+    write_carts = cart_service_module.write_carts
+
+    async def failing_write_carts(db, carts):
+        if any(c.user_id == "unwritable" for c in carts):
+            raise ValueError("cannot write this cart")
+        await write_carts(db, carts)
+
+    monkeypatch.setattr(cart_service_module, "write_carts", failing_write_carts)
+
+    async def run():
+        for user_id in ("flush-1", "unwritable", "flush-2"):
+            await cart_store.put(None, _cart(user_id))
+        await cart_service.flush()
+
+        async with async_session() as db:
+            for user_id in ("flush-1", "flush-2"):
+                assert (await load_cart(db, user_id)).items[0].price == 2.0
+        assert await cart_store.get("unwritable") is None
+        assert await cart_store.take_dirty(10) == []
+
+    client.portal.call(run)
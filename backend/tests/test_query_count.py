@@ -0,0 +1,86 @@
+import pytest
+
+from app.core.config import settings
+from app.services import cart_service as cart_service_module
+from app.services.cart_store import DatabaseCartStore
+from tests.conftest import API
+
+@pytest.fixture(autouse=True)
+def query_count_limit(monkeypatch):
+    # X-Query-Count is only reported while the guard is on
+    monkeypatch.setattr(settings, "QUERY_COUNT_LIMIT", 1000)
+
+def _user(client, email: str, role: str = "consumer") -> dict:
+    client.post(f"{API}/auth/signup", params={"role": role}, json={"email": email, "full_name": email, "password": "pw"})
+    token = client.post(f"{API}/auth/login/access-token", data={"username": email, "password": "pw"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def _queries(response) -> int:
+    assert response.status_code == 200, response.text
+    return int(response.headers["X-Query-Count"])
+
+@pytest.fixture(scope="module")
+def products(client):
+    seller = _user(client, "qc-seller@example.com", role="seller")
+    products = []
+    for i in range(10):
+        r = client.post(f"{API}/products/", headers=seller, json={
+            "name": f"Counted {i}", "description": "d", "price": 2.0, "seller_id": "x", "stock": 100, "category": "c",
+        })
+        assert r.status_code == 200, r.text
+        products.append(r.json())
+    return products
+
+def _place_orders(client, headers: dict, products: list, count: int):
+    for i in range(count):
+        # Two lines per order, so every order has more than one item row
+        for product in products[i % 5:i % 5 + 2]:
+            client.post(f"{API}/store/cart/add", headers=headers, json={
+                "product_id": product["id"], "quantity": 1, "price": product["price"], "product_name": product["name"],
+            })
+        r = client.post(f"{API}/store/orders/checkout", headers=headers)
+        assert r.status_code == 200, r.text
+
+def test_order_reads_take_a_constant_number_of_queries(client, products):
+    one, many = _user(client, "qc-one@example.com"), _user(client, "qc-many@example.com")
+    _place_orders(client, one, products, 1)
+    _place_orders(client, many, products, 20)
+
+    r_one = client.get(f"{API}/store/orders", headers=one)
+    r_many = client.get(f"{API}/store/orders", headers=many)
+    assert len(r_one.json()) == 1 and len(r_many.json()) == 20
+    assert _queries(r_one) == _queries(r_many)
+
+    details = [_queries(client.get(f"{API}/store/orders/{o['id']}", headers=h)) for h, o in ((one, r_one.json()[0]), (many, r_many.json()[-1]))]
+    assert details[0] == details[1]
+
+def test_cart_writes_take_a_constant_number_of_queries(client, products, monkeypatch):
+    # The default write-through store, where every cart change reaches the database
+    monkeypatch.setattr(cart_service_module, "cart_store", DatabaseCartStore())
+    headers = _user(client, "qc-cart@example.com")
+
+    def add(product):
+        return client.post(f"{API}/store/cart/add", headers=headers, json={
+            "product_id": product["id"], "quantity": 1, "price": product["price"], "product_name": product["name"],
+        })
+
+    # The first add also creates the cart
+    adds = [_queries(add(product)) for product in products]
+    assert len(set(adds[1:])) == 1, adds
+
+    updates = [_queries(client.put(f"{API}/store/cart/items/{products[i]['id']}", headers=headers, json={"quantity": 3})) for i in (0, 9)]
+    assert updates[0] == updates[1], updates
+    assert len(client.get(f"{API}/store/cart", headers=headers).json()["items"]) == 10
+
+def test_a_request_over_the_limit_fails(client, products, monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    headers = _user(client, "qc-limit@example.com")
+    _place_orders(client, headers, products, 1)
+    queries = _queries(client.get(f"{API}/store/orders", headers=headers))
+
+    monkeypatch.setattr(settings, "QUERY_COUNT_LIMIT", queries - 1)
+    # Not entered as a context manager: the app is already started by `client`
+    r = TestClient(main.app, raise_server_exceptions=False).get(f"{API}/store/orders", headers=headers)
+    assert r.status_code == 500
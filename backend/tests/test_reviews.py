@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, select
+
+from app.models.product import Product
+from app.models.review import Review
+from app.services import review_service  # noqa: F401 registers the duplicate cleanup
+
+def test_duplicate_reviews_are_dropped_before_the_unique_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/reviews.db")
+    review, product = Review.__table__, Product.__table__
+    unique = next(i for i in review.indexes if i.name == "ix_review_product_id_user_id")
+    with engine.begin() as conn:
+        product.create(conn)
+        review.create(conn)
+        unique.drop(conn)
+        conn.execute(insert(product).values(id="p", name="n", description="d", price=1.0, seller_id="s", stock=1, category="c",
+                                            images=[], videos=[], created_at=datetime(2026, 1, 1), updated_at=datetime(2026, 1, 1)))
+        for review_id, user_id, rating, day in (("old", "u", 2, 1), ("new", "u", 5, 3), ("mid", "u", 4, 2), ("other", "u2", 3, 1)):
+            conn.execute(insert(review).values(id=review_id, product_id="p", user_id=user_id, user_name="n", rating=rating,
+                                               comment="c", images=[], created_at=datetime(2026, 1, day)))
+
+        unique.create(conn)
+
+        assert sorted(conn.execute(select(review.c.id)).scalars()) == ["new", "other"]
+        row = conn.execute(select(product.c.rating_count, product.c.rating_sum, product.c.rating_5, product.c.rating_2)).one()
+        assert tuple(row) == (2, 8, 1, 0)
@@ -12,6 +12,8 @@ export default function MerchantOrdersPage() {
     const [orders, setOrders] = useState<any[]>([]);
     const [fetchError, setFetchError] = useState<string | null>(null);
     const [updating, setUpdating] = useState<string | null>(null);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         if (!loading && (!user || user.role !== "seller")) {
@@ -26,14 +28,30 @@ export default function MerchantOrdersPage() {
 
     const loadOrders = async () => {
         try {
-            const data = await fetchMerchantOrders(token!);
-            setOrders(data);
+            const page = await fetchMerchantOrders(token!);
+            setOrders(page.orders);
+            setNextCursor(page.nextCursor);
         } catch (e) {
             console.error("Failed to load orders", e);
             setFetchError("Failed to load orders");
         }
     };
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const page = await fetchMerchantOrders(token!, nextCursor);
+            setOrders(prev => [...prev, ...page.orders]);
+            setNextCursor(page.nextCursor);
+        } catch (e) {
+            console.error("Failed to load orders", e);
+            setFetchError("Failed to load orders");
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleStatusUpdate = async (orderId: string, productId: string, newStatus: string) => {
         setUpdating(`${orderId}-${productId}`);
         try {
@@ -149,6 +167,17 @@ export default function MerchantOrdersPage() {
                             </div>
                         </div>
                     ))}
+                    {nextCursor && (
+                        <div className="flex justify-center">
+                            <button
+                                onClick={loadMore}
+                                disabled={loadingMore}
+                                className="text-sm border border-input rounded px-4 py-2 bg-background hover:bg-accent/50 text-foreground disabled:opacity-50"
+                            >
+                                {loadingMore ? "Loading..." : "Load more"}
+                            </button>
+                        </div>
+                    )}
                 </div>
             )}
         </div>
@@ -6,7 +6,7 @@ import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Card, CardHeader, CardTitle, CardContent } from "@/components/ui/card";
 import { useRouter } from "next/navigation";
-import { fetchProducts, createProduct, updateProduct, deleteProduct, fetchMerchantOrders, updateOrderItemStatus, uploadFile, Product, getImageUrl } from "@/lib/api";
+import { fetchProducts, createProduct, updateProduct, deleteProduct, fetchMerchantOrders, updateOrderItemStatus, uploadFile, UPLOAD_ACCEPT, Product, getImageUrl } from "@/lib/api";
 import { Trash2, Edit, X } from "lucide-react";
 import { Label } from "@/components/ui/label";
 
@@ -42,7 +42,7 @@ export default function DashboardPage() {
         }
         if (token) {
             loadProducts();
-            fetchMerchantOrders(token).then(setOrders).catch(console.error);
+            fetchMerchantOrders(token).then(page => setOrders(page.orders)).catch(console.error);
         }
     }, [user, token, router, authLoading]);
 
@@ -153,7 +153,7 @@ export default function DashboardPage() {
             await updateOrderItemStatus(token, orderId, productId, newStatus);
             // Reload orders
             const updatedOrders = await fetchMerchantOrders(token);
-            setOrders(updatedOrders);
+            setOrders(updatedOrders.orders);
         } catch (e) {
             alert("Failed to update status");
         }
@@ -257,7 +257,7 @@ export default function DashboardPage() {
                                             </div>
                                             <Input
                                                 type="file"
-                                                accept="image/*"
+                                                accept={UPLOAD_ACCEPT.image}
                                                 multiple
                                                 onChange={(e) => handleFileUpload(e, 'image')}
                                                 disabled={uploading}
@@ -287,7 +287,7 @@ export default function DashboardPage() {
                                             </div>
                                             <Input
                                                 type="file"
-                                                accept="video/*"
+                                                accept={UPLOAD_ACCEPT.video}
                                                 multiple
                                                 onChange={(e) => handleFileUpload(e, 'video')}
                                                 disabled={uploading}
@@ -198,12 +198,15 @@ export async function fetchOrder(token: string, orderId: string) {
     return res.json();
 }
 
-export async function fetchMerchantOrders(token: string) {
-    const res = await fetch(`${API_URL}/store/merchant/orders`, {
+// One page, newest first; pass nextCursor back for the next one (null on the last page)
+export async function fetchMerchantOrders(token: string, cursor?: string | null) {
+    const params = new URLSearchParams();
+    if (cursor) params.set("cursor", cursor);
+    const res = await fetch(`${API_URL}/store/merchant/orders?${params.toString()}`, {
         headers: { Authorization: `Bearer ${token}` }
     });
     if (!res.ok) throw await res.json();
-    return res.json();
+    return { orders: await res.json(), nextCursor: res.headers.get("X-Next-Cursor") };
 }
 
 export async function updateOrderItemStatus(token: string, orderId: string, productId: string, status: string) {
@@ -254,6 +257,12 @@ export async function createReview(token: string, review: any) {
     return res.json();
 }
 
+// File input accept lists; keep in line with UPLOAD_TYPES in the backend settings
+export const UPLOAD_ACCEPT = {
+    image: ".jpg,.jpeg,.png,.gif,.webp,.avif,.heic,.heif,.bmp,.tif,.tiff",
+    video: ".mp4,.m4v,.webm,.mov,.mkv,.avi,.ogv,.3gp",
+};
+
 export async function uploadFile(token: string, file: File) {
     const formData = new FormData();
     formData.append("file", file);